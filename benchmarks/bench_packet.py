@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+import argparse
+import timeit
+from xiaomi_lightbar import baseband
+
+description = """
+    Micro-benchmark of the packet builder: byte concatenation, like the
+    original implementation, with a hand-written bitwise CRC16 over the 15
+    bytes (not the crc package it used, no longer a dependency) against the
+    precomputed packet templates with the table-driven CRC16, and the packet
+    cache.
+"""
+
+parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("-n", "--number", type=int, default=100000, help="Packets per measurement")
+parser.add_argument("-r", "--repeat", type=int, default=5, help="Measurements, the best one is reported")
+args = parser.parse_args()
+
+ID = 0xABCDEF
+
+
+def crc16_bitwise(data: bytes) -> int:
+    """CRC16 bit by bit, a hand-written reference (not the crc package used before)"""
+    reg = baseband.crc16_init
+    for byte in data:
+        for bit in range(7, -1, -1):
+            feedback = (reg >> 15) ^ (byte >> bit & 1)
+            reg = (reg << 1) & 0xFFFF
+            if feedback:
+                reg ^= baseband.crc16_polynomial
+    return reg
+
+
+def packet_original(id: int, command: int, counter: int) -> bytes:
+    """The packet builder before the templates, for reference"""
+    x = baseband.preamble.to_bytes(8, 'big')
+    x += id.to_bytes(3, 'big')
+    x += baseband.separator.to_bytes(1, 'big')
+    x += counter.to_bytes(1, 'big')
+    x += command.to_bytes(2, 'big')
+    x += crc16_bitwise(x).to_bytes(2, 'big')
+    return x
+
+
+# Both must produce exactly the same packets
+for counter in range(256):
+    for command in (0x0100, 0x0201, 0x03FF, 0x0401, 0x05FF, 0x0600, 0x04F0, 0x02F0):
+        assert packet_original(ID, command, counter) == baseband.packet(ID, command, counter)
+
+template = baseband.template(ID)
+cache = baseband.PacketCache()
+candidates = {
+    "concat+bitwise_crc": lambda: packet_original(ID, 0x0100, 0x72),
+    "packet": lambda: baseband.packet(ID, 0x0100, 0x72),
+    "template.build": lambda: template.build(0x0100, 0x72),
+    "PacketCache.get": lambda: cache.get(ID, 0x0100, 0x72),
+}
+
+baseline = None
+for name, func in candidates.items():
+    best = min(timeit.repeat(func, number=args.number, repeat=args.repeat))
+    rate = args.number / best
+    baseline = baseline or rate
+    print(f"{name:18} {1e6*best/args.number:8.3f} µs/packet {rate:12.0f} packets/s  x{rate/baseline:.1f}")
@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+
+import argparse
+import contextlib
+import importlib.util
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import types
+from xiaomi_lightbar import baseband, Lightbar, RadioBridge
+from xiaomi_lightbar.policy import HopPattern, TxPolicy
+from xiaomi_lightbar.scheduler import LEVEL, TxScheduler
+from xiaomi_lightbar.sim import SimulatedBar, SimulatedRadio, VirtualClock
+
+description = """
+    Performance benchmarks of the library, without hardware (fake and simulated radios).
+    The results are printed (or saved) as JSON, to track regressions between releases.
+
+    - packet: packets built per second (packet, template, cache).
+    - send: wall time of Lightbar.send, blocking and with a scheduler (time to return).
+    - levels: end-to-end latency of brightness() and color_temp(), with and without state tracking.
+    - mqtt: latency from MqttController.on_message to the first packet written.
+    - strategies: simulated airtime and success rate of the transmit strategies, in virtual time.
+    - priorities: latency of the toggles under a heavy load of ramps, with and without priority classes,
+      in virtual time.
+    - import: import time of the library modules, in a fresh interpreter, and whether pyrf24 is loaded.
+"""
+
+parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+parser.add_argument("-o", "--output", type=str, default=None, help="JSON file (default: stdout)")
+parser.add_argument("-q", "--quick", action="store_true", help="Fewer repetitions, less accurate")
+parser.add_argument("benchmarks", nargs="*", default=["packet", "send", "levels", "mqtt", "strategies", "priorities",
+                                                    "import"],
+                    help="Benchmarks to run (default: all)")
+
+ID = 0xABCDEF
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class TimestampRadio:
+    """Fake radio, keeps the time of each write"""
+
+    def __init__(self):
+        self.channel = 6
+        self.times = []
+
+    def write(self, buf):
+        self.times.append(time.perf_counter())
+        return True
+
+
+def summary(samples: list) -> dict:
+    """Statistics of a list of times, in seconds"""
+    samples = sorted(samples)
+    return {
+        "n": len(samples),
+        "min_s": samples[0],
+        "median_s": statistics.median(samples),
+        "max_s": samples[-1],
+    }
+
+
+def bench_packet(quick: bool) -> dict:
+    number = 10000 if quick else 100000
+    template = baseband.template(ID)
+    cache = baseband.PacketCache()
+    funcs = {
+        "packet": lambda: baseband.packet(ID, 0x0100, 0x72),
+        "template.build": lambda: template.build(0x0100, 0x72),
+        "PacketCache.get": lambda: cache.get(ID, 0x0100, 0x72),
+    }
+    return {name: {"packets_per_s": number / min(timeit.repeat(func, number=number, repeat=3))}
+            for name, func in funcs.items()}
+
+
+def bench_send(quick: bool) -> dict:
+    n = 2 if quick else 5
+    results = {}
+
+    radio = TimestampRadio()
+    bar = Lightbar(None, None, ID, radio=radio)
+    samples = []
+    for _ in range(n):
+        start = time.perf_counter()
+        bar.send(0x0100)
+        samples.append(time.perf_counter() - start)
+    results["blocking"] = summary(samples)
+
+    with RadioBridge(None, None, radio=TimestampRadio()) as bridge:
+        bar = bridge.lightbar(ID)
+        samples = []
+        for _ in range(n):
+            start = time.perf_counter()
+            future = bar.send(0x0100)
+            samples.append(time.perf_counter() - start)
+            future.result()
+    results["scheduled_return"] = summary(samples)
+    return results
+
+
+def bench_levels(quick: bool) -> dict:
+    n = 2 if quick else 5
+    results = {}
+    for track_state in (False, True):
+        bar = Lightbar(None, None, ID, radio=TimestampRadio())
+        bar.track_state = track_state
+        for method in ("brightness", "color_temp"):
+            samples = []
+            for i in range(n):
+                start = time.perf_counter()
+                getattr(bar, method)(4 + i % 2)
+                samples.append(time.perf_counter() - start)
+            results[f"{method}{'_tracked' if track_state else ''}"] = summary(samples)
+    return results
+
+
+def load_subscriber():
+    """Import mqtt/subscriber.py, not a package"""
+    spec = importlib.util.spec_from_file_location("subscriber", os.path.join(ROOT, "mqtt", "subscriber.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_mqtt(quick: bool) -> dict:
+    subscriber = load_subscriber()
+    n = 3 if quick else 10
+    radio = TimestampRadio()
+    samples = []
+    with RadioBridge(None, None, radio=radio) as bridge, contextlib.redirect_stdout(sys.stderr):
+        controller = subscriber.MqttController("localhost", 1883, "", "", "xiaomi/lightbar", bridge.lightbar(ID))
+        controller.start_workers()
+        try:
+            for i in range(n):
+                msg = types.SimpleNamespace(topic="xiaomi/lightbar/brightness/set", payload=str(100 + i).encode())
+                written = len(radio.times)
+                start = time.perf_counter()
+                controller.on_message(controller.client, None, msg)
+                while len(radio.times) == written:
+                    time.sleep(0.0001)
+                samples.append(radio.times[written] - start)
+                while controller.devices[0].lightbar.pending or bridge.scheduler.pending:
+                    time.sleep(0.001)
+                time.sleep(2*bridge.scheduler.delay_s)  # Messages apart, not queued
+        finally:
+            controller.stop_workers()
+    return {"on_message_to_first_packet": summary(samples)}
+
+
+def bench_strategies(quick: bool) -> dict:
+    commands = 50 if quick else 500
+    strategies = {
+        "fixed_20": {},
+        "policy": {"policy": TxPolicy(loss=0.5, delay_s=0.01)},
+        "hopping_policy": {"policy": TxPolicy(loss=0.5, delay_s=0.01), "hopping": HopPattern()},
+    }
+    results = {}
+    for name, attributes in strategies.items():
+        radio = SimulatedRadio(loss={6: 0.9, 15: 0.3, 43: 0.3, 68: 0.3}, seed=0)
+        device = radio.add_bar(SimulatedBar(ID))
+        bar = Lightbar(None, None, ID, radio=radio)
+        bar.clock = radio.clock
+        for key, value in attributes.items():
+            setattr(bar, key, value)
+        for _ in range(commands):
+            bar.on_off()
+        results[name] = {
+            "commands": commands,
+            "success_rate": len(device.log) / commands,
+            "packets_per_command": radio.packets / commands,
+            "airtime_per_command_s": radio.busy_s / commands,
+            "latency_per_command_s": radio.clock.monotonic() / commands,
+        }
+    return results
+
+
+def bench_priorities(quick: bool) -> dict:
+    toggles = 50 if quick else 500
+    ramps = 8  # Remotes with ramp steps always queued
+    results = {}
+    for name, prioritized in (("fifo", False), ("priorities", True)):
+        clock = VirtualClock()
+        radio = SimulatedRadio(clock)
+        scheduler = TxScheduler(radio, delay_s=0.01, clock=clock)
+        bars = [Lightbar(None, None, ID + i, radio=radio) for i in range(ramps + 1)]
+        for bar in bars:
+            bar.scheduler = scheduler
+        latencies = []
+        next_toggle = 0.0
+        while len(latencies) < toggles:
+            for bar in bars[1:]:
+                if scheduler.pending < 4*ramps:
+                    bar.send(0x0401, priority=None if prioritized else LEVEL)
+            if clock.monotonic() >= next_toggle:
+                future = bars[0].send(0x0100, priority=None if prioritized else LEVEL)
+                future.add_done_callback(lambda f: latencies.append(f.result().latency))
+                next_toggle = clock.monotonic() + 0.5
+            scheduler.step()
+            clock.sleep(scheduler.delay_s)
+        latencies.sort()
+        results[name] = dict(summary(latencies), p99_s=latencies[int(0.99*(len(latencies) - 1))],
+                             airtime_fraction=radio.busy_s / clock.monotonic())
+    return results
+
+
+IMPORT_CODE = """
+import sys, time
+start = time.perf_counter()
+{statement}
+print(time.perf_counter() - start, "pyrf24" in sys.modules)
+"""
+
+
+def bench_import(quick: bool) -> dict:
+    n = 3 if quick else 10
+    statements = {
+        "baseband": "import xiaomi_lightbar.baseband",
+        "calibration": "import xiaomi_lightbar.calibration",
+        "package": "import xiaomi_lightbar",
+        "Lightbar": "from xiaomi_lightbar import Lightbar",
+        "RadioBridge": "from xiaomi_lightbar import RadioBridge",
+    }
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    results = {}
+    for name, statement in statements.items():
+        samples = []
+        for _ in range(n):
+            output = subprocess.run([sys.executable, "-c", IMPORT_CODE.format(statement=statement)],
+                                    env=env, capture_output=True, text=True, check=True).stdout.split()
+            samples.append(float(output[0]))
+        results[name] = dict(summary(samples), pyrf24_loaded=output[1] == "True")
+    return results
+
+
+BENCHMARKS = {
+    "packet": bench_packet,
+    "send": bench_send,
+    "levels": bench_levels,
+    "mqtt": bench_mqtt,
+    "strategies": bench_strategies,
+    "priorities": bench_priorities,
+    "import": bench_import,
+}
+
+
+def main():
+    args = parser.parse_args()
+    results = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "machine": platform.machine(),
+        "quick": args.quick,
+        "results": {name: BENCHMARKS[name](args.quick) for name in args.benchmarks},
+    }
+    text = json.dumps(results, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,63 @@
 "load_ok = ""Xiaomi Mi Computer Monitor Light Bar integration."""
 
+import asyncio
 import logging
 
 from homeassistant.config_entries import ConfigEntry
 from homeassistant.const import Platform
 from homeassistant.core import HomeAssistant
+from homeassistant.exceptions import ConfigEntryNotReady
 
-from .const import DOMAIN
+from xiaomi_lightbar import RadioBridge
+from xiaomi_lightbar.counters import CounterStore
+from xiaomi_lightbar.sim import SimulatedRadio
+from xiaomi_lightbar.telemetry import Telemetry
+
+from .const import DOMAIN, BRIDGES, USERS, RADIOS, LOCK, COUNTERS, COUNTERS_FILE, DEVICE_ID, CE_PIN, CS_PIN
 
 _LOGGER = logging.getLogger(__name__)
 
-PLATFORMS: list[Platform] = [Platform.LIGHT]
+PLATFORMS: list[Platform] = [Platform.LIGHT, Platform.SENSOR]
+
+
+def domain_data(hass: HomeAssistant) -> dict:
+    """hass.data[DOMAIN], created on first use (config flow or setup)"""
+    return hass.data.setdefault(DOMAIN, {BRIDGES: {}, USERS: {}, RADIOS: {}, LOCK: asyncio.Lock()})
+
+
+def open_bridge(pins: tuple, counter_store: CounterStore, radio=None) -> RadioBridge:
+    """Initialize the radio (blocking SPI), in the executor, unless already done"""
+    if pins[0] < 0:
+        radio = SimulatedRadio()  # Just for debugging
+    return RadioBridge(*pins, radio=radio, counter_store=counter_store, telemetry=Telemetry())
 
 
 async def async_setup_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     """Set up Xiaomi Mi Computer Monitor Light Bar from a config entry."""
     _LOGGER.debug("entry: %s", entry.entry_id)
 
-    hass.data.setdefault(DOMAIN, {})
-    hass.data[DOMAIN][entry.entry_id] = entry.data
+    data = domain_data(hass)
+    data[entry.entry_id] = entry.data
+
+    # One radio for all the light bars on the same pins, opened by the first
+    # entry and closed with the last one. The entries are set up concurrently.
+    pins = (entry.data[CE_PIN], entry.data[CS_PIN])
+    async with data[LOCK]:
+        # Counters kept between restarts, or the bar may drop the first commands
+        if COUNTERS not in data:
+            path = hass.config.path(".storage", COUNTERS_FILE)
+            data[COUNTERS] = await hass.async_add_executor_job(CounterStore, path)
+
+        if pins not in data[BRIDGES]:
+            # The radio checked by the config flow, if any, is not initialized again
+            radio = data[RADIOS].pop(pins, None)
+            try:
+                data[BRIDGES][pins] = await hass.async_add_executor_job(open_bridge, pins, data[COUNTERS], radio)
+            except (OSError, RuntimeError) as e:
+                data.pop(entry.entry_id, None)
+                raise ConfigEntryNotReady(f"nRF24L01 not responding: {e}") from e
+        data[USERS].setdefault(pins, set()).add(entry.entry_id)
+
     await hass.config_entries.async_forward_entry_setups(entry, PLATFORMS)
     return True
 
@@ -28,7 +67,20 @@ async def async_unload_entry(hass: HomeAssistant, entry: ConfigEntry) -> bool:
     if unload_ok := await hass.config_entries.async_unload_platforms(
         entry, PLATFORMS
     ):
-        hass.data[DOMAIN].pop(entry.entry_id, None)
+        data = hass.data[DOMAIN]
+        data.pop(entry.entry_id, None)
+        pins = (entry.data[CE_PIN], entry.data[CS_PIN])
+        async with data[LOCK]:
+            users = data[USERS].get(pins, set())
+            users.discard(entry.entry_id)
+            bridge = data[BRIDGES].get(pins)
+            if bridge is not None:
+                bridge.lightbars.pop(entry.data[DEVICE_ID], None)
+                if not users:  # The last one, release the radio
+                    del data[BRIDGES][pins], data[USERS][pins]
+                    await hass.async_add_executor_job(bridge.close)
+            if not data[BRIDGES] and COUNTERS in data:
+                await hass.async_add_executor_job(data.pop(COUNTERS).close)
     return unload_ok
 
 
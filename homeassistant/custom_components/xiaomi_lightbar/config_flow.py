@@ -4,14 +4,15 @@ from typing import Any
 import logging
 import voluptuous as vol
 
-from xiaomi_lightbar import Lightbar
+from xiaomi_lightbar.radio import open_radio
 
 from homeassistant import config_entries
 from homeassistant.core import HomeAssistant
 from homeassistant.data_entry_flow import FlowResult
 from homeassistant.exceptions import HomeAssistantError
 
-from .const import (DOMAIN, DEVICE_ID, CE_PIN, CS_PIN)
+from . import domain_data
+from .const import (DOMAIN, BRIDGES, RADIOS, LOCK, DEVICE_ID, CE_PIN, CS_PIN)
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -41,11 +42,18 @@ async def validate_input(hass: HomeAssistant,
     ce_pin = data[CE_PIN]
     cs_pin = data[CS_PIN]
 
-    if ce_pin >= 0:  # ce_pin<0: debugging
-        try:
-            Lightbar(ce_pin, cs_pin, device_id)
-        except RuntimeError:
-            raise CannotConnect
+    # A radio already in use by other light bars, or already checked, is
+    # fine. Otherwise, initialize it in the executor (blocking SPI), not in
+    # the event loop, and keep it for the bridge of the entry (see
+    # async_setup_entry), so it is initialized once.
+    pins = (ce_pin, cs_pin)
+    data = domain_data(hass)
+    async with data[LOCK]:
+        if ce_pin >= 0 and pins not in data[BRIDGES] and pins not in data[RADIOS]:  # ce_pin<0: debugging
+            try:
+                data[RADIOS][pins] = await hass.async_add_executor_job(open_radio, ce_pin, cs_pin)
+            except (OSError, RuntimeError):
+                raise CannotConnect
 
     return {"title": f"Light bar 0x{device_id:0{6}x}"}
 
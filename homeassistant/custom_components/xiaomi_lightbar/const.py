@@ -6,6 +6,9 @@ DEVICE_ID = "device_id"
 CE_PIN = "ce_pin"
 CS_PIN = "cs_pin"
 
-BRIGHTNESS_SCALE = (0, 15)
-COLOR_TEMP_SCALE = (0, 15)
-KELVIN_SCALE = (2700, 6500)
+BRIDGES = "bridges"  # hass.data[DOMAIN][BRIDGES][(ce_pin, cs_pin)], shared radios
+USERS = "users"  # hass.data[DOMAIN][USERS][(ce_pin, cs_pin)], entry ids using each radio
+RADIOS = "radios"  # hass.data[DOMAIN][RADIOS][(ce_pin, cs_pin)], checked by the config flow, not used yet
+LOCK = "lock"  # hass.data[DOMAIN][LOCK], opening and closing the radios
+COUNTERS = "counters"  # hass.data[DOMAIN][COUNTERS], persistent counters
+COUNTERS_FILE = "xiaomi_lightbar.counters"  # In .storage
@@ -1,10 +1,11 @@
 import logging
 
 from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceInfo
 from homeassistant.helpers.entity_platform import AddEntitiesCallback
 from homeassistant.config_entries import ConfigEntry
-from homeassistant.exceptions import HomeAssistantError
-from homeassistant.util.scaling import scale_to_ranged_value
+from homeassistant.const import STATE_ON
+from homeassistant.helpers.restore_state import RestoreEntity
 
 from homeassistant.components.light import (
     ATTR_BRIGHTNESS,
@@ -13,12 +14,9 @@ from homeassistant.components.light import (
     LightEntity,
 )
 
-from xiaomi_lightbar import Lightbar
+from xiaomi_lightbar import AsyncLightbar
 
-from .const import (
-    DOMAIN, DEVICE_ID, CE_PIN, CS_PIN,
-    BRIGHTNESS_SCALE, COLOR_TEMP_SCALE, KELVIN_SCALE
-)
+from .const import DOMAIN, BRIDGES, DEVICE_ID, CE_PIN, CS_PIN
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -33,70 +31,120 @@ async def async_setup_entry(
     data = hass.data[DOMAIN][entry.entry_id]
     _LOGGER.debug("Setting up lights %s", data)
 
-    entities = [LightbarEntity(data[CE_PIN], data[CS_PIN], data[DEVICE_ID])]
+    bridge = hass.data[DOMAIN][BRIDGES][(data[CE_PIN], data[CS_PIN])]
+    entities = [LightbarEntity(bridge.lightbar(data[DEVICE_ID], AsyncLightbar))]
     async_add_entities(entities)
 
 
-class LightbarEntity(LightEntity):
+def merge_levels(old: tuple, brightness, color_temp) -> tuple:
+    """Levels superseding old (brightness, color temperature), None keeps the old one"""
+    return (old[0] if brightness is None else brightness,
+            old[1] if color_temp is None else color_temp)
+
+
+class LightbarEntity(LightEntity, RestoreEntity):
+    """A light bar, with the last known state restored after a restart.
+
+    The bar does not report its state, so it is whatever was sent last. Only
+    the commands that change something are sent: turning on a lit bar, or
+    asking for the same brightness or temperature level, sends nothing.
 
-    def __init__(self, ce_pin: int, cs_pin: int, device_id: int):
+    While a sequence of levels is being sent (e.g. dragging a slider), the
+    new levels wait, and only the latest ones are sent after it (see
+    xiaomi_lightbar.coalesce for the same with the MQTT subscriber). If the
+    bar is turned off meanwhile, they wait for the next turn on.
+    """
+
+    def __init__(self, device: AsyncLightbar):
         """Initialize the state variable"""
 
         self._attr_is_on = False
+        self._attr_brightness = None
+        self._attr_color_temp_kelvin = None
+        self._attr_color_mode = ColorMode.COLOR_TEMP
         self._attr_supported_color_modes = [ColorMode.COLOR_TEMP]
-        self._attr_min_color_temp_kelvin = KELVIN_SCALE[0]
-        self._attr_max_color_temp_kelvin = KELVIN_SCALE[1]
-
-        if ce_pin >= 0:
-            try:
-                self._device = Lightbar(ce_pin, cs_pin, device_id)
-            except RuntimeError:
-                raise CannotConnect
-        else:  # Just for debugging
-            self._device = DummyLightbar(ce_pin, cs_pin, device_id)
-
-        _LOGGER.debug("LightbarEntity constructor (%s %s %s)",
-                      ce_pin, cs_pin, device_id)
+        self._attr_min_color_temp_kelvin = device.calibration.min_kelvin
+        self._attr_max_color_temp_kelvin = device.calibration.max_kelvin
+        self._attr_device_info = DeviceInfo(
+            identifiers={(DOMAIN, f"{device.id:06x}")},
+            name=f"Light bar {device.id:06x}",
+            manufacturer="Xiaomi",
+            model="MJGJD01YL",
+        )
+        self._device = device
+        self._sending_levels = False
+        self._pending_levels = None  # (brightness, color temperature) waiting
+        self._deferred_levels = None  # Pending when turned off, sent when turned on
+
+        _LOGGER.debug("LightbarEntity constructor (%s)", device.id)
 
     @property
     def unique_id(self):
         return f"{self._device.id:0{6}x}"
 
-    def turn_on(self, **kwargs):
+    async def async_added_to_hass(self) -> None:
+        """Restore the last state, or the first on_off would toggle the wrong way"""
+        await super().async_added_to_hass()
+        if (last_state := await self.async_get_last_state()) is None:
+            return
+        self._attr_is_on = last_state.state == STATE_ON
+        self._attr_brightness = last_state.attributes.get(ATTR_BRIGHTNESS)
+        self._attr_color_temp_kelvin = last_state.attributes.get(ATTR_COLOR_TEMP_KELVIN)
+        _LOGGER.debug("Restored %s: %s", self.unique_id, last_state)
+
+    async def async_turn_on(self, **kwargs):
         _LOGGER.debug("Turning on %s", kwargs)
+        calibration = self._device.calibration
         if not self.is_on:
-            self._device.on_off()
-            self._attr_is_on = True
+            self._attr_is_on = True  # Before awaiting, do not toggle twice
+            await self._device.async_on_off()
 
+        brightness = color_temp = None
         if ATTR_BRIGHTNESS in kwargs:
-            brightness = kwargs[ATTR_BRIGHTNESS]
-            self._attr_brightness = brightness
-            val = scale_to_ranged_value((0, 255), BRIGHTNESS_SCALE, brightness)
-            self._device.brightness(int(val))
-            _LOGGER.debug("Brightness %s", val)
+            new, old = kwargs[ATTR_BRIGHTNESS], self._attr_brightness
+            self._attr_brightness = new
+            if old is None or calibration.brightness(new) != calibration.brightness(old):
+                brightness = calibration.brightness(new)
 
         if ATTR_COLOR_TEMP_KELVIN in kwargs:
-            kelvin = kwargs[ATTR_COLOR_TEMP_KELVIN]
-            self._attr_color_temp_kelvin = kelvin
-            val = scale_to_ranged_value(KELVIN_SCALE, COLOR_TEMP_SCALE, kelvin)
-            self._device.color_temp(int(val))
-            _LOGGER.debug("Kelvin %s", val)
+            new, old = kwargs[ATTR_COLOR_TEMP_KELVIN], self._attr_color_temp_kelvin
+            self._attr_color_temp_kelvin = new
+            if old is None or calibration.kelvin(new) != calibration.kelvin(old):
+                color_temp = calibration.kelvin(new)
 
-    def turn_off(self, **kwargs):
+        if self._deferred_levels is not None:
+            brightness, color_temp = merge_levels(self._deferred_levels, brightness, color_temp)
+            self._deferred_levels = None
+
+        if brightness is not None or color_temp is not None:
+            _LOGGER.debug("Brightness %s, color temperature %s", brightness, color_temp)
+            await self._async_set_levels(brightness, color_temp)
+
+    async def async_turn_off(self, **kwargs):
         _LOGGER.debug("Turning off %s", kwargs)
         if self.is_on:
             self._attr_is_on = False
-            self._device.on_off()
-
-
-class CannotConnect(HomeAssistantError):
-    """Error to indicate device is not responding."""
-
-
-class DummyLightbar(Lightbar):
-    """A Lightbar that does nothing"""
-    
-    def __init__(self, ce_pin, cs_pin, device_id):
-        self.counter = 0
-        self.repetitions = 0
-        self.id = device_id
+            if self._pending_levels is not None:  # Not for a dark bar
+                self._deferred_levels = self._pending_levels
+                self._pending_levels = None
+            await self._device.async_on_off()
+
+    async def _async_set_levels(self, brightness, color_temp):
+        """Send the levels, or merge them with the pending ones if busy"""
+        if self._sending_levels:
+            if self._pending_levels is not None:
+                brightness, color_temp = merge_levels(self._pending_levels, brightness, color_temp)
+                if self._device.telemetry is not None:
+                    self._device.telemetry.count("collapsed", self._device.id, "set_levels")
+            self._pending_levels = (brightness, color_temp)
+            return
+        self._sending_levels = True
+        try:
+            while True:
+                await self._device.async_set_levels(brightness, color_temp)
+                if self._pending_levels is None:
+                    break
+                brightness, color_temp = self._pending_levels
+                self._pending_levels = None
+        finally:
+            self._sending_levels = False
@@ -0,0 +1,71 @@
+import logging
+
+from homeassistant.core import HomeAssistant
+from homeassistant.helpers.device_registry import DeviceInfo
+from homeassistant.helpers.entity import EntityCategory
+from homeassistant.helpers.entity_platform import AddEntitiesCallback
+from homeassistant.config_entries import ConfigEntry
+
+from homeassistant.components.sensor import (
+    SensorEntity,
+    SensorStateClass,
+)
+
+from xiaomi_lightbar.telemetry import Telemetry
+
+from .const import DOMAIN, BRIDGES, DEVICE_ID, CE_PIN, CS_PIN
+
+_LOGGER = logging.getLogger(__name__)
+
+# Diagnostic sensors of the transmissions of each light bar (see
+# xiaomi_lightbar.telemetry), polled: recording them costs nothing to the
+# transmissions. (key, name, unit, state class)
+COUNTS = (
+    ("packets", "Packets sent", None, SensorStateClass.TOTAL_INCREASING),
+    ("write_errors", "Write errors", None, SensorStateClass.TOTAL_INCREASING),
+    ("bursts", "Commands sent", None, SensorStateClass.TOTAL_INCREASING),
+    ("dropped", "Commands dropped", None, SensorStateClass.TOTAL_INCREASING),
+)
+LATENCIES = (
+    ("queue_s", "Queue latency", "ms", SensorStateClass.MEASUREMENT),
+    ("burst_s", "Burst duration", "ms", SensorStateClass.MEASUREMENT),
+)
+
+
+async def async_setup_entry(
+    hass: HomeAssistant,
+    entry: ConfigEntry,
+    async_add_entities: AddEntitiesCallback,
+) -> None:
+    """Set up entry."""
+
+    data = hass.data[DOMAIN][entry.entry_id]
+    bridge = hass.data[DOMAIN][BRIDGES][(data[CE_PIN], data[CS_PIN])]
+    if bridge.telemetry is None:
+        return
+    entities = [TelemetrySensor(bridge.telemetry, data[DEVICE_ID], *description)
+                for description in COUNTS + LATENCIES]
+    async_add_entities(entities)
+
+
+class TelemetrySensor(SensorEntity):
+
+    _attr_entity_category = EntityCategory.DIAGNOSTIC
+
+    def __init__(self, telemetry: Telemetry, remote_id: int, key: str, name: str, unit: str,
+                 state_class: SensorStateClass):
+        self._telemetry = telemetry
+        self._remote_id = remote_id
+        self._key = key
+        self._attr_name = f"Light bar {remote_id:06x} {name}"
+        self._attr_unique_id = f"{remote_id:06x}_{key}"
+        self._attr_native_unit_of_measurement = unit
+        self._attr_state_class = state_class
+        self._attr_device_info = DeviceInfo(identifiers={(DOMAIN, f"{remote_id:06x}")})
+
+    def update(self) -> None:
+        if self._key in ("queue_s", "burst_s"):
+            mean = self._telemetry.mean(self._key, self._remote_id)
+            self._attr_native_value = None if mean is None else round(1000 * mean, 2)
+        else:
+            self._attr_native_value = self._telemetry.total(self._key, self._remote_id)
@@ -1,6 +1,10 @@
 import paho.mqtt.client as mqtt
-from xiaomi_lightbar import Lightbar
+from xiaomi_lightbar import RadioBridge
+from xiaomi_lightbar.coalesce import Coalescer
+from xiaomi_lightbar.counters import CounterStore
+from xiaomi_lightbar.telemetry import Telemetry, serve_prometheus
 import argparse
+import json
 
 description = """
     MQTT subscriber for Xiaomi Lightbar Home Assistant MQTT Light integration.
@@ -16,106 +20,272 @@ parser.add_argument("--password", type=str, default="", help="MQTT Password")
 parser.add_argument("--topic", type=str, default="xiaomi/lightbar", help="MQTT Topic")
 parser.add_argument("--ce_pin", type=int, default=25, help="CE Pin")
 parser.add_argument("--csn_pin", type=int, default=0, help="CSN Pin")
-parser.add_argument("--remote_id", type=lambda x: int(x, 16), default=0xABCDEF, help="Remote ID")
+parser.add_argument("--remote_id", type=lambda x: int(x, 16), nargs="+", default=[0xABCDEF], help="Remote ID (one or more)")
+parser.add_argument("--discovery_prefix", type=str, default="", help="Home Assistant MQTT discovery prefix (e.g. homeassistant)")
+parser.add_argument("--counter_file", type=str, default="", help="File to keep the counters between restarts")
+parser.add_argument("--track_state", action="store_true", help="Set levels with a single relative step when known")
+parser.add_argument("--metrics_port", type=int, default=0, help="Port of the Prometheus metrics (0: disabled)")
 
-args = parser.parse_args()
+class Device:
+    """A light bar served by the controller, with its command queue and state"""
 
-CE_PIN = args.ce_pin
-CSN_PIN = args.csn_pin
-REMOTE_ID = args.remote_id
-BROKER = args.broker
-PORT = args.port
-USERNAME = args.username
-PASSWORD = args.password
-TOPIC = args.topic
+    def __init__(self, lightbar, base_topic):
+        self.id = lightbar.id
+        self.topic = base_topic  # e.g. xiaomi/lightbar/abcdef
+        # Commands are queued and sent from a worker thread, so the network
+        # thread (keepalives, message intake) never waits for the radio.
+        # Superseded brightness and temperature values (e.g. while dragging a
+        # slider) are dropped.
+        self.lightbar = Coalescer(lightbar)
+        self.lightbar.telemetry = lightbar.telemetry
+        self.calibration = lightbar.calibration
+        # Last requested state, published in the state topic. Repeated values
+        # are not sent again (e.g. the same on_off command multiple times).
+        # We assume the default state to be ON
+        self.state = {"state": "ON", "brightness": None, "color_temp": None}
+        # Levels requested while off, sent after the next ON (Home Assistant
+        # sends the brightness before the ON, see on_command_type)
+        self.deferred = {}
 
-# Create Lightbar and MqttController instances
-lightbar = Lightbar(ce_pin=CE_PIN, csn_pin=CSN_PIN, remote_id=REMOTE_ID)
 
 class MqttController:
-    def __init__(self, broker, port, username, password, topic, lightbar):
+    """MQTT bridge for one or many light bars.
+
+    Each bar has its topics under topic/<remote id>, e.g.
+    xiaomi/lightbar/abcdef/brightness/set. With a single bar, the topics
+    without the remote id (xiaomi/lightbar/brightness/set) also work.
+
+    Besides the control, brightness/set and temperature/set topics, the set
+    topic takes the JSON schema of the Home Assistant MQTT light, e.g.
+    {"state": "ON", "brightness": 128, "color_temp": 250}, sent as one
+    sequence of commands. The state is published back, as JSON, in the
+    state topic.
+    """
+
+    def __init__(self, broker, port, username, password, topic, lightbars, discovery_prefix=""):
         self.client = mqtt.Client(mqtt.CallbackAPIVersion.VERSION2)
         if username != "":
             self.client.username_pw_set(username, password)
         self.broker = broker
         self.port = port
         self.topic = topic + "/#"
-        self.lightbar = lightbar
-        # Store the previous control state to avoid sending the same on_off command multiple times
-        # we assume the default state to be ON
-        self.previous_control_state = "ON"
+        self.discovery_prefix = discovery_prefix
+        if not isinstance(lightbars, (list, tuple)):
+            lightbars = [lightbars]
+        self.devices = [Device(bar, f"{topic}/{bar.id:06x}") for bar in lightbars]
+        self._threaded = False
+
+        # Dispatch table, topic -> (device, handler), built once
+        self.routes = {}
+        for device in self.devices:
+            self.add_routes(device.topic, device)
+        if len(self.devices) == 1:
+            self.add_routes(topic, self.devices[0])
 
         self.client.on_connect = self.on_connect
         self.client.on_message = self.on_message
+
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         self.stop()
 
+    def add_routes(self, base_topic, device):
+        self.routes[f"{base_topic}/set"] = (device, self.on_json)
+        self.routes[f"{base_topic}/control"] = (device, self.on_control)
+        self.routes[f"{base_topic}/brightness/set"] = (device, self.on_brightness)
+        self.routes[f"{base_topic}/temperature/set"] = (device, self.on_temperature)
+
     def on_connect(self, client, userdata, flags, rc, properties):
         if rc == 0:
             print("Connected to MQTT Broker!")
             client.subscribe(self.topic)
+            if self.discovery_prefix:
+                for device in self.devices:
+                    self.announce(device)
         else:
             print(f"Failed to connect, return code: {rc}")
             self.stop()
 
+    def announce(self, device):
+        """Publish the Home Assistant MQTT discovery config of a bar"""
+        object_id = f"xiaomi_lightbar_{device.id:06x}"
+        config = {
+            "name": None,  # Just the device name
+            "unique_id": object_id,
+            "schema": "json",
+            "command_topic": f"{device.topic}/set",
+            "state_topic": f"{device.topic}/state",
+            "brightness": True,
+            "supported_color_modes": ["color_temp"],
+            "min_mireds": device.calibration.min_mireds,
+            "max_mireds": device.calibration.max_mireds,
+            "device": {
+                "identifiers": [object_id],
+                "name": f"Xiaomi Lightbar {device.id:06x}",
+                "manufacturer": "Xiaomi",
+                "model": "MJGJD01YL",
+            },
+        }
+        topic = f"{self.discovery_prefix}/light/{object_id}/config"
+        self.client.publish(topic, json.dumps(config), retain=True)
+
     def on_message(self, client, userdata, msg):
         print(f"{msg.topic} {msg.payload}")
-        if msg.topic == self.topic.replace("#", "control"):
-            if msg.payload == b"ON":
-                if self.previous_control_state != "ON":
-                    self.lightbar.on_off()
-                    self.previous_control_state = "ON"
-            if msg.payload == b"OFF":
-                if self.previous_control_state != "OFF":
-                    self.lightbar.on_off()
-                    self.previous_control_state = "OFF"
-
-        elif msg.topic == self.topic.replace("#", "brightness/set"):
-            val = int(msg.payload)
-            scaled_val = round((val / 255) * 15)
-            print(f"Brightness: {scaled_val}")
-            self.lightbar.brightness(scaled_val)
-        elif msg.topic == self.topic.replace("#", "temperature/set"):
-            val = int(msg.payload)
-            scaled_val = scale_value(val)
-            print(f"temperature: {scaled_val}")
-            self.lightbar.color_temp(scaled_val)
+        route = self.routes.get(msg.topic)
+        if route is not None:
+            device, handler = route
+            handler(device, msg.payload)
+
+    def on_control(self, device, payload):
+        if payload in (b"ON", b"OFF"):
+            self.update(device, state=payload.decode())
+
+    def on_brightness(self, device, payload):
+        try:
+            val = int(payload)
+        except ValueError:
+            print(f"Invalid brightness: {payload}")
+            return
+        self.update(device, brightness=val)
+
+    def on_temperature(self, device, payload):
+        try:
+            val = int(payload)
+        except ValueError:
+            print(f"Invalid temperature: {payload}")
+            return
+        self.update(device, color_temp=val)
+
+    def on_json(self, device, payload):
+        try:
+            request = json.loads(payload)
+            state = request.get("state")
+            brightness = request.get("brightness")
+            color_temp = request.get("color_temp")
+            if state not in (None, "ON", "OFF"):
+                raise ValueError(state)
+            brightness = None if brightness is None else int(brightness)
+            color_temp = None if color_temp is None else int(color_temp)
+        except (ValueError, TypeError, AttributeError):
+            print(f"Invalid JSON command: {payload}")
+            return
+        self.update(device, state, brightness, color_temp)
+
+    def update(self, device, state=None, brightness=None, color_temp=None):
+        """Send the changes to a bar, as one sequence of commands, and publish its state.
+
+        The values already set are skipped. Turning on goes first, so the
+        levels apply to a lit bar. The levels requested while off are kept,
+        and sent after turning on.
+        """
+        current = device.state
+        if brightness == current["brightness"]:
+            brightness = None
+        if color_temp == current["color_temp"]:
+            color_temp = None
+        if state == current["state"]:
+            state = None
+
+        if state is not None:
+            device.lightbar.on_off()
+            current["state"] = state
+        if brightness is not None:
+            current["brightness"] = brightness
+        if color_temp is not None:
+            current["color_temp"] = color_temp
+        if current["state"] == "OFF":
+            if brightness is not None:
+                device.deferred["brightness"] = brightness
+            if color_temp is not None:
+                device.deferred["color_temp"] = color_temp
+            brightness = color_temp = None
+        elif device.deferred:
+            if brightness is None:
+                brightness = device.deferred.get("brightness")
+            if color_temp is None:
+                color_temp = device.deferred.get("color_temp")
+            device.deferred.clear()
+
+        level_brightness = level_temperature = None
+        if brightness is not None:
+            level_brightness = device.calibration.brightness(brightness)
+        if color_temp is not None:
+            level_temperature = device.calibration.mireds(color_temp)
+        if level_brightness is not None or level_temperature is not None:
+            print(f"Brightness: {level_brightness}, temperature: {level_temperature} "
+                  f"(collapsed: {device.lightbar.collapsed})")
+            device.lightbar.set_levels(level_brightness, level_temperature)
+        self.publish_state(device)
+
+    def publish_state(self, device):
+        state = {key: value for key, value in device.state.items() if value is not None}
+        if "color_temp" in state:
+            # Home Assistant only reads color_temp along with the color mode
+            state["color_mode"] = "color_temp"
+        self.client.publish(f"{device.topic}/state", json.dumps(state), retain=True)
+
+    def start_workers(self):
+        for device in self.devices:
+            device.lightbar.start()
+
+    def stop_workers(self):
+        for device in self.devices:
+            device.lightbar.stop()
 
     def start(self):
+        """Connect and process the network traffic in a background thread"""
         try:
+            self.start_workers()
             self.client.connect(self.broker, self.port, 60)
             self.client.loop_start()
+            self._threaded = True
         except Exception as e:
             print(f"Failed to connect to MQTT broker: {e}")
 
+    def run(self):
+        """Connect and process the network traffic in this thread, until stopped.
+
+        It blocks waiting for network events (no busy loop), and reconnects
+        if the connection is lost.
+        """
+        self.start_workers()
+        self.client.connect_async(self.broker, self.port, 60)
+        self.client.loop_forever(retry_first_connection=True)
+
     def stop(self):
-        self.client.loop_stop()
+        if self._threaded:
+            self.client.loop_stop()
+            self._threaded = False
         self.client.disconnect()
-
-def scale_value(t):
-    if 153 <= t <= 219:
-        a1, b1 = 153, 219
-        c1, d1 = 15, 7
-        f_t = c1 + (d1 - c1) * ((t - a1) / (b1 - a1))
-    elif 219 < t <= 370:
-        a2, b2 = 219, 370
-        c2, d2 = 7, 0
-        f_t = c2 + (d2 - c2) * ((t - a2) / (b2 - a2))
-    else:
-        f_t = None
-    return round(f_t) if f_t is not None else None
+        self.stop_workers()
 
 def main():
+    args = parser.parse_args()
+
+    # Create Lightbar and MqttController instances
+    counter_store = CounterStore(args.counter_file) if args.counter_file else None
+    telemetry = Telemetry() if args.metrics_port else None
+    bridge = RadioBridge(ce_pin=args.ce_pin, csn_pin=args.csn_pin, counter_store=counter_store,
+                         telemetry=telemetry)
+    metrics = serve_prometheus(telemetry, args.metrics_port) if telemetry is not None else None
+    lightbars = [bridge.lightbar(remote_id) for remote_id in args.remote_id]
+    for lightbar in lightbars:
+        lightbar.track_state = args.track_state
+
     try:
-        with MqttController(BROKER, PORT, USERNAME, PASSWORD, TOPIC, lightbar) as controller:
-            controller.start()
-            while True:  # Keep the program running
-                pass
+        with MqttController(args.broker, args.port, args.username, args.password, args.topic, lightbars,
+                            args.discovery_prefix) as controller:
+            controller.run()
     except KeyboardInterrupt:
         print("\nInterrupted by user. Exiting...")
+    finally:
+        if metrics is not None:
+            metrics.shutdown()
+        bridge.close()
+        if counter_store is not None:
+            counter_store.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import argparse
+import time
+from xiaomi_lightbar import Lightbar
+from xiaomi_lightbar.policy import CHANNELS, ChannelStats, TxPolicy
+from xiaomi_lightbar.radio import open_rx_radio
+
+description = """
+    Measure the packet loss next to a light bar, to tune the repetitions of each command.
+
+    It requires two nRF24L01 modules: the transmitter, where it will be installed, and a receiver
+    placed next to the bar. The transmitter sends bursts of a harmless command (an invalid code,
+    silently ignored by the bar), and the receiver counts the packets that arrive. Then, the
+    repetitions needed for each kind of command are printed (see xiaomi_lightbar.policy).
+"""
+
+parser = argparse.ArgumentParser(description=description, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+parser.add_argument("-c", "--channel", type=int, default=6, help="6 (default), 15, 43, 68 (or +1) -> 2406 MHz, 2043 MHz, 2068 MH")
+parser.add_argument("-i", "--id", type=lambda x: int(x, 16), default=0xABCDEF, help="ID of the remote.")
+parser.add_argument("--hop", action="store_true", help=f"Hop between channels {CHANNELS}, with statistics per channel")
+parser.add_argument("-n", "--packets", type=int, default=500, help="Packets to send")
+parser.add_argument("--tx_pins", type=int, nargs=2, default=[25, 0], help="CE and CSN pins of the transmitter")
+parser.add_argument("--rx_pins", type=int, nargs=2, default=[24, 1], help="CE and CSN pins of the receiver")
+
+args = parser.parse_args()
+
+bar = Lightbar(args.tx_pins[0], args.tx_pins[1], args.id)
+bar.radio.channel = args.channel
+rx = open_rx_radio(args.rx_pins[0], args.rx_pins[1], args.channel)
+rx.flush_rx()
+
+channels = CHANNELS if args.hop else (args.channel,)
+stats = ChannelStats()
+sent = received = 0
+for counter in range(args.packets):
+    channel = channels[counter % len(channels)]
+    if args.hop:
+        bar.radio.channel = rx.channel = channel
+    start = time.monotonic()
+    bar.radio.write(bar.packet(0x0800, counter % 256))  # Invalid code, ignored
+    sent += 1
+    time.sleep(bar.delay_s)
+    ok = rx.available()
+    if ok:
+        received += 1
+        rx.flush_rx()
+    stats.record(channel, ok, time.monotonic() - start)
+
+for channel, summary in stats.summary().items():
+    print(f"Channel {channel}: success rate {summary['success_rate']:.3f}")
+
+policy = TxPolicy.from_measurement(sent, received, delay_s=bar.delay_s)
+print(f"Received {received} of {sent} packets, estimated loss {policy.loss:.3f}")
+print("Repetitions:")
+for kind, code in (("toggle", 0x0100), ("step", 0x0401), ("saturate", 0x04F0)):
+    print(f"• {kind}: {policy.repetitions(code)}")
+print(f"Use bar.policy = TxPolicy.from_measurement({sent}, {received})")
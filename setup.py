@@ -10,6 +10,11 @@ setup(name='xiaomi_lightbar_nrf24',
       packages=['xiaomi_lightbar'],
       install_requires=[
           'pyrf24',
-          'crc',
       ],
+      extras_require={
+          'decode': ['numpy'],
+      },
+      entry_points={
+          'console_scripts': ['xiaomi-lightbar = xiaomi_lightbar.cli:main'],
+      },
       zip_safe=False)
@@ -0,0 +1,39 @@
+class FakeRadio:
+    """Records the written packets and their channels, no hardware needed"""
+
+    def __init__(self):
+        self.channel = 6
+        self.written = []
+        self.channels = []
+
+    def write(self, buf):
+        self.written.append(bytes(buf))
+        self.channels.append(self.channel)
+        return True
+
+
+class FifoRadio(FakeRadio):
+    """Also records the calls of the TX FIFO methods (write_fast, reuse_tx, tx_standby, flush_tx)"""
+
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def write(self, buf):
+        self.calls.append("write")
+        return super().write(buf)
+
+    def write_fast(self, buf):
+        self.calls.append("write_fast")
+        self.written.append(bytes(buf))
+        return True
+
+    def reuse_tx(self):
+        self.calls.append("reuse_tx")
+
+    def tx_standby(self):
+        self.calls.append("tx_standby")
+        return True
+
+    def flush_tx(self):
+        self.calls.append("flush_tx")
@@ -3,3 +3,46 @@ from xiaomi_lightbar.baseband import packet
 x_bytes = packet(id=0xABCDEF, command=0x0100, counter=0x72)
 x = int.from_bytes(x_bytes, "big")
 assert x == 0x533914dd1c493412abcdefff720100fad4
+
+# The templates and the table-driven CRC match a bit-by-bit CRC16
+from xiaomi_lightbar.baseband import crc16_checksum, template
+
+
+def crc16_bitwise(data: bytes) -> int:
+    reg = 0xFFFE
+    for byte in data:
+        for bit in range(7, -1, -1):
+            feedback = (reg >> 15) ^ (byte >> bit & 1)
+            reg = (reg << 1) & 0xFFFF
+            if feedback:
+                reg ^= 0x1021
+    return reg
+
+
+for counter in (0x00, 0x72, 0xFF):
+    for command in (0x0100, 0x0201, 0x03FF, 0x04F0):
+        x_bytes = packet(id=0x5421FE, command=command, counter=counter)
+        assert crc16_bitwise(x_bytes[:15]) == int.from_bytes(x_bytes[15:], "big")
+        assert crc16_checksum(x_bytes[:15]) == int.from_bytes(x_bytes[15:], "big")
+        assert template(0x5421FE).build(command, counter) == x_bytes
+
+# The packet cache returns the same packets, and counts hits and misses
+from xiaomi_lightbar.baseband import PacketCache
+
+cache = PacketCache(maxsize=2)
+assert cache.get(0xABCDEF, 0x0100, 0x72) == packet(0xABCDEF, 0x0100, 0x72)
+assert cache.get(0xABCDEF, 0x0100, 0x73) == packet(0xABCDEF, 0x0100, 0x73)
+cache.get(0xABCDEF, 0x0401, 0)
+cache.get(0xABCDEF, 0x05FF, 0)  # Evicts on_off, the least recently used
+cache.get(0xABCDEF, 0x0100, 0)
+assert cache.cache_info() == (1, 4, 2, 2)
+
+# Command codes: name and signed step, None if unknown
+from xiaomi_lightbar.baseband import parse_command
+
+assert parse_command(0x0100) == ("on_off", 0)
+assert parse_command(0x0600) == ("reset", 0)
+assert parse_command(0x0403) == ("higher", 3)
+assert parse_command(0x05FE) == ("lower", -2)
+assert parse_command(0x0700) == (None, 0)
+assert parse_command(0x0800) == (None, 0)
@@ -0,0 +1,22 @@
+from xiaomi_lightbar.calibration import Calibration, DEFAULT, interpolate
+from xiaomi_lightbar.radio import Lightbar
+from fake_radio import FakeRadio
+
+# The measured curve, in mireds and kelvin
+assert [DEFAULT.mireds(m) for m in (153, 219, 370)] == [15, 7, 0]
+assert DEFAULT.mireds(186) == round(interpolate(((153, 15), (219, 7)), 186)) == 11
+assert DEFAULT.kelvin(6500) == 15
+assert DEFAULT.kelvin(4566) == 7
+assert DEFAULT.kelvin(2703) == 0
+
+# Out of range values are clamped, not errors
+assert DEFAULT.mireds(100) == 15 and DEFAULT.mireds(500) == 0
+assert DEFAULT.kelvin(2000) == 0 and DEFAULT.kelvin(10000) == 15
+assert [DEFAULT.brightness(b) for b in (-5, 0, 128, 255, 300)] == [0, 0, 8, 15, 15]
+
+# A bar with its own calibration
+bar = Lightbar(None, None, 0xABCDEF, radio=FakeRadio())
+assert bar.calibration is DEFAULT
+bar.calibration = Calibration(mireds_curve=((153, 15), (370, 0)), brightness_curve=((0, 1), (200, 15)))
+assert bar.calibration.mireds(219) == 10
+assert bar.calibration.brightness(0) == 1 and bar.calibration.brightness(220) == 15
@@ -0,0 +1,41 @@
+from xiaomi_lightbar.baseband import packet
+from xiaomi_lightbar.coalesce import Coalescer
+from xiaomi_lightbar.radio import Lightbar
+from fake_radio import FakeRadio
+
+radio = FakeRadio()
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 1
+bar.delay_s = 0
+
+# A slider drag: only the last brightness is sent, toggles are never dropped,
+# and the targets do not move past them
+coalescer = Coalescer(bar)
+for value in range(10):
+    coalescer.brightness(value)
+coalescer.on_off()
+coalescer.on_off()
+coalescer.color_temp(3)
+coalescer.brightness(5)
+coalescer.brightness(12)
+assert coalescer.collapsed == 10
+assert coalescer.pending == 5
+
+while coalescer.step():
+    pass
+assert radio.written == [
+    packet(0xABCDEF, 0x04F0, 0), packet(0xABCDEF, 0x0409, 1),
+    packet(0xABCDEF, 0x0100, 2),
+    packet(0xABCDEF, 0x0100, 3),
+    packet(0xABCDEF, 0x02F0, 4), packet(0xABCDEF, 0x0203, 5),
+    packet(0xABCDEF, 0x04F0, 6), packet(0xABCDEF, 0x040C, 7),
+]
+
+# Both levels at once: pending values are merged, the newest wins
+radio.written.clear()
+coalescer.set_levels(brightness=2)
+coalescer.set_levels(color_temp=5)
+coalescer.set_levels(brightness=4)
+assert coalescer.pending == 1
+coalescer.step()
+assert [int.from_bytes(p[13:15], "big") for p in radio.written] == [0x04F0, 0x0404, 0x02F0, 0x0205]
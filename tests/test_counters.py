@@ -0,0 +1,48 @@
+import os
+import tempfile
+from xiaomi_lightbar.bridge import RadioBridge
+from xiaomi_lightbar.counters import CounterStore
+from fake_radio import FakeRadio
+
+path = os.path.join(tempfile.mkdtemp(), "counters")
+
+# The counters survive a restart, with a safety jump
+with CounterStore(path, jump=16) as store:
+    with RadioBridge(None, None, radio=FakeRadio(), delay_s=0, counter_store=store) as bridge:
+        bar = bridge.lightbar(0xABCDEF)
+        assert bar.counter == 0
+        bar.repetitions = 1
+        for _ in range(250):
+            bar.on_off()
+        bridge.lightbar(0x111111).on_off(counter=9)  # Explicit counters are not stored
+
+with CounterStore(path, jump=16) as store:
+    assert store.load(0xABCDEF) == (249 + 16) % 256
+    assert store.load(0x111111) == 0
+    assert os.path.getsize(path) == 4  # Compacted
+
+# A torn record (crash while writing) is ignored
+with open(path, "ab") as f:
+    f.write(b"\xab\xcd")
+with CounterStore(path, jump=1) as store:
+    assert store.load(0xABCDEF) == 250
+
+# The sync thread compacts the file when it grows
+with CounterStore(path, compact_ratio=4) as store:
+    for counter in range(100):
+        store.update(0xABCDEF, counter)
+        store.update(0x111111, counter)
+    assert os.path.getsize(path) > 100
+    store.sync()
+    assert os.path.getsize(path) == 8
+    store.update(0xABCDEF, 100)
+with CounterStore(path, jump=0) as store:
+    assert store.load(0xABCDEF) == 100 and store.load(0x111111) == 99
+
+# A bar resumes its counter when the store is attached
+from xiaomi_lightbar.radio import Lightbar
+
+with CounterStore(path, jump=1) as store:
+    bar = Lightbar(None, None, 0xABCDEF, radio=FakeRadio())
+    bar.counter_store = store
+    assert bar.counter == 101
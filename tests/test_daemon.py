@@ -0,0 +1,62 @@
+import os
+import socket
+import tempfile
+import threading
+import time
+from xiaomi_lightbar import RadioBridge
+from xiaomi_lightbar.cli import main, send
+from xiaomi_lightbar.daemon import Daemon
+from fake_radio import FakeRadio
+
+
+def codes(radio):
+    return [int.from_bytes(p[13:15], "big") for p in radio.written]
+
+
+radio = FakeRadio()
+path = os.path.join(tempfile.mkdtemp(), "lightbar.sock")
+with RadioBridge(None, None, radio=radio, delay_s=0) as bridge, Daemon(bridge, path) as daemon:
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+    for bar in (0xABCDEF, 0x123456):
+        bridge.lightbar(bar).repetitions = 1
+
+    # Several commands through one connection, one reply each
+    replies = send(path, ["abcdef on_off", "abcdef higher 2", "123456 brightness 3", "abcdef kelvin 6500",
+                          "abcdef dance", "abcdef brightness", "xyz on_off", ""])
+    assert replies[:4] == ["ok"] * 4
+    assert all(reply.startswith("error") for reply in replies[4:])
+
+    # Out of range codes are rejected, without using a counter
+    assert send(path, ["abcdef code 0x10000", "abcdef code -1"]) == ["error code out of range 0x0000-0xFFFF"] * 2
+
+    # Another daemon cannot take the socket
+    try:
+        Daemon(bridge, path)
+        assert False
+    except OSError:
+        pass
+
+    # The command line client
+    assert main(["--socket", path, "send", "abcdef", "code", "0x0600"]) == 0
+    assert main(["--socket", path, "send", "abcdef", "lower", "x"]) == 1
+
+    while bridge.scheduler.pending:
+        time.sleep(0.001)
+    daemon.shutdown()
+
+assert not os.path.exists(path)
+assert sorted(codes(radio)) == sorted([0x0100, 0x0402, 0x04F0, 0x0403, 0x02F0, 0x020F, 0x0600])
+assert bridge.lightbar(0xABCDEF).counter == 5  # One counter for all the commands
+
+# A stale socket is replaced, anything else is not removed
+with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as stale:
+    stale.bind(path)
+with Daemon(bridge, path):
+    pass
+with open(path, "w"):
+    pass
+try:
+    Daemon(bridge, path)
+    assert False
+except FileExistsError:
+    assert os.path.isfile(path)
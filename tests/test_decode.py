@@ -0,0 +1,46 @@
+from xiaomi_lightbar.baseband import packet
+from xiaomi_lightbar.decode import Packet, StreamDecoder, decode
+
+
+def capture(pkt: bytes, shift: int, junk: int = 0x1B5) -> bytes:
+    """12 byte capture: the end of the preamble, the payload from shift, junk"""
+    tail = int.from_bytes(pkt[:8], "big") & ((1 << shift) - 1)
+    payload = int.from_bytes(pkt[8:], "big")
+    n_junk = 96 - shift - 72
+    x = (tail << 72 | payload) << n_junk | junk & ((1 << n_junk) - 1)
+    return x.to_bytes(12, "big")
+
+
+# The expected capture, with the payload at bit 15, and misaligned ones
+captures = [
+    capture(packet(0x5421FE, 0x0100, 0x72), 15),
+    capture(packet(0x5421FE, 0x0401, 0x73), 12),
+    bytes(12),  # Noise
+    capture(packet(0xABCDEF, 0x03FF, 0x00), 21),
+]
+assert decode(captures) == [
+    Packet(0x5421FE, 0x72, 0x0100, 15),
+    Packet(0x5421FE, 0x73, 0x0401, 12),
+    Packet(0xABCDEF, 0x00, 0x03FF, 21),
+]
+
+
+class FakeReceiver:
+    payload_size = 12
+
+    def __init__(self, captures):
+        self.fifo = list(captures)
+
+    def available(self):
+        return bool(self.fifo)
+
+    def read(self, size):
+        return self.fifo.pop(0)
+
+
+# Streaming, the repetitions of a packet are reported once
+pkt = capture(packet(0x5421FE, 0x0100, 0x72), 15)
+decoder = StreamDecoder(FakeReceiver(3*[pkt] + captures), batch=4)
+assert decoder.new_packets(decoder.drain()) == [Packet(0x5421FE, 0x72, 0x0100, 15)]
+assert len(decoder.new_packets(decoder.drain())) == 2
+assert (decoder.captures, decoder.decoded) == (7, 6)
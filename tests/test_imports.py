@@ -0,0 +1,15 @@
+import os
+import subprocess
+import sys
+
+# The protocol modules, and the package itself, do not load the radio driver
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+code = """
+import sys
+import xiaomi_lightbar, xiaomi_lightbar.baseband, xiaomi_lightbar.calibration, xiaomi_lightbar.sim
+assert "pyrf24" not in sys.modules
+assert "xiaomi_lightbar.radio" not in sys.modules
+from xiaomi_lightbar import Lightbar, AsyncLightbar, RadioBridge
+assert "pyrf24" not in sys.modules
+"""
+subprocess.run([sys.executable, "-c", code], cwd=root, check=True)
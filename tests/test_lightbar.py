@@ -0,0 +1,141 @@
+from xiaomi_lightbar.baseband import packet
+from xiaomi_lightbar.radio import Lightbar
+from fake_radio import FakeRadio
+
+
+def codes(radio):
+    """Command codes of the written packets"""
+    return [int.from_bytes(pkt[13:15], "big") for pkt in radio.written]
+
+
+radio = FakeRadio()
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 1
+bar.delay_s = 0
+
+# Without state tracking, saturate and adjust each time
+bar.brightness(8)
+bar.brightness(8)
+assert codes(radio) == [0x04F0, 0x0408, 0x04F0, 0x0408]
+assert radio.written[-1] == packet(0xABCDEF, 0x0408, 3)
+
+# With state tracking, a single relative step, or nothing at all
+radio.written.clear()
+bar.track_state = True
+bar.resync_every = 4
+bar.brightness(11)
+bar.brightness(6)
+bar.brightness(6)
+bar.higher(2)
+bar.brightness(9)
+assert codes(radio) == [0x0403, 0x04FB, 0x0402, 0x0401]
+assert bar.levels["brightness"] == 9
+
+# Resynchronize every resync_every changes, and when unknown
+bar.brightness(9)
+bar.color_temp(0)
+bar.reset()
+bar.color_temp(2)
+assert codes(radio)[4:] == [0x04F0, 0x0409, 0x02F0, 0x0200, 0x0600, 0x02F0, 0x0202]
+
+# With a transmit policy, toggles get more repetitions than saturations
+from xiaomi_lightbar.policy import TxPolicy
+
+radio.written.clear()
+bar.policy = TxPolicy.from_measurement(sent=100, received=50, delay_s=0)
+bar.track_state = False
+bar.on_off()
+bar.brightness(3)
+assert codes(radio) == 14*[0x0100] + 7*[0x04F0] + 10*[0x0403]
+
+# Frequency hopping, with statistics per channel
+from xiaomi_lightbar.policy import HopPattern
+
+radio.written.clear()
+radio.channels.clear()
+bar.policy = None
+bar.repetitions = 5
+bar.hopping = HopPattern(channels=(6, 43), dwell=2)
+bar.on_off()
+assert radio.channels == [6, 6, 43, 43, 6]
+assert bar.hopping.stats.summary()[43]["writes"] == 2
+assert bar.hopping.stats.success_rate(6) is None  # Only a receiver knows
+
+# Both levels in one sequence, only the changes when tracked
+radio.written.clear()
+radio.channels.clear()
+bar.hopping = None
+bar.repetitions = 1
+bar.track_state = True
+bar.levels = {"brightness": None, "color_temp": None}
+bar.set_levels(brightness=5, color_temp=7)
+bar.set_levels(brightness=5, color_temp=4)
+bar.set_levels()
+assert codes(radio) == [0x04F0, 0x0405, 0x02F0, 0x0207, 0x02FD]
+
+# A radio with a TX FIFO, if enabled: the payload is loaded once, then reused
+from fake_radio import FifoRadio
+
+radio = FifoRadio()
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 3
+bar.delay_s = 0
+bar.fifo_burst = True
+bar.on_off()
+assert radio.calls == ["write_fast", "reuse_tx", "reuse_tx", "tx_standby"]
+assert radio.written == [packet(0xABCDEF, 0x0100, 0)]
+
+# Not with hopping, or if disabled (the default): a write per repetition
+radio.calls.clear()
+bar.hopping = HopPattern(channels=(6, 43), dwell=2)
+bar.on_off()
+bar.hopping = None
+bar.fifo_burst = False
+bar.on_off()
+assert radio.calls == 6*["write"]
+
+# A burst stopped early flushes the FIFO, so the next one sends its own payload
+radio.calls.clear()
+bar.fifo_burst = True
+burst = bar.burst(packet(0xABCDEF, 0x0100, 9), 3)
+next(burst)
+burst.close()
+bar.on_off()
+assert radio.calls == ["write_fast", "flush_tx", "tx_standby", "write_fast", "reuse_tx", "reuse_tx", "tx_standby"]
+
+# Concurrent asyncio bars on the same radio do not share its FIFO
+import asyncio
+from xiaomi_lightbar import AsyncLightbar
+
+radio = FifoRadio()
+bars = [AsyncLightbar(None, None, id, radio=radio) for id in (0x111111, 0x222222)]
+for bar in bars:
+    bar.repetitions = 2
+    bar.delay_s = 0
+    bar.fifo_burst = True
+
+
+async def toggle_all():
+    await asyncio.gather(*(bar.async_on_off() for bar in bars))
+
+asyncio.run(toggle_all())
+assert radio.calls == 4*["write"]
+assert radio.written == 2*[packet(0x111111, 0x0100, 0), packet(0x222222, 0x0100, 0)]
+
+# The async controller tracks the levels too
+radio = FakeRadio()
+bar = AsyncLightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 1
+bar.delay_s = 0
+bar.track_state = True
+
+
+async def steps():
+    await bar.async_brightness(5)
+    await bar.async_higher(4)
+    await bar.async_brightness(5)
+    await bar.async_reset()
+    await bar.async_brightness(12)
+
+asyncio.run(steps())
+assert codes(radio) == [0x04F0, 0x0405, 0x0404, 0x04FC, 0x0600, 0x04F0, 0x040C]
@@ -0,0 +1,48 @@
+import importlib.util
+import json
+import os
+import types
+from xiaomi_lightbar.baseband import packet
+from xiaomi_lightbar.radio import Lightbar
+from fake_radio import FakeRadio
+
+# mqtt/subscriber.py is a script, not a package
+path = os.path.join(os.path.dirname(__file__), "..", "mqtt", "subscriber.py")
+spec = importlib.util.spec_from_file_location("subscriber", path)
+subscriber = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(subscriber)
+
+radio = FakeRadio()
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 1
+bar.delay_s = 0
+controller = subscriber.MqttController("localhost", 1883, "", "", "xiaomi/lightbar", bar)
+published = []
+controller.client.publish = lambda topic, payload, retain: published.append((topic, json.loads(payload)))
+device = controller.devices[0]
+
+
+def message(topic, payload):
+    controller.on_message(controller.client, None, types.SimpleNamespace(topic=topic, payload=payload))
+    while device.lightbar.step():
+        pass
+
+
+# Home Assistant sends the brightness before the ON: it is kept while off,
+# and sent after turning on
+message("xiaomi/lightbar/control", b"OFF")
+message("xiaomi/lightbar/brightness/set", b"255")
+assert radio.written == [packet(0xABCDEF, 0x0100, 0)]
+assert published[-1] == ("xiaomi/lightbar/abcdef/state", {"state": "OFF", "brightness": 255})
+message("xiaomi/lightbar/control", b"ON")
+assert radio.written[1:] == [packet(0xABCDEF, 0x0100, 1), packet(0xABCDEF, 0x04F0, 2), packet(0xABCDEF, 0x040F, 3)]
+assert published[-1] == ("xiaomi/lightbar/abcdef/state", {"state": "ON", "brightness": 255})
+
+# The color temperature goes with its color mode
+message("xiaomi/lightbar/temperature/set", b"153")
+assert published[-1] == ("xiaomi/lightbar/abcdef/state",
+                         {"state": "ON", "brightness": 255, "color_temp": 153, "color_mode": "color_temp"})
+
+# Unchanged values are not sent again
+message("xiaomi/lightbar/abcdef/set", b'{"state": "ON", "brightness": 255}')
+assert len(radio.written) == 6
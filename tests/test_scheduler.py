@@ -0,0 +1,176 @@
+from xiaomi_lightbar.baseband import packet
+from xiaomi_lightbar.radio import Lightbar
+from xiaomi_lightbar.scheduler import TxScheduler
+from fake_radio import FakeRadio
+
+
+# Commands to different remotes are interleaved, to the same remote in order
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0)
+a = [scheduler.submit(0x111111, packet(0x111111, 0x0100, n), 2) for n in (1, 2)]
+b = scheduler.submit(0x222222, packet(0x222222, 0x0100, 7), 3)
+assert scheduler.pending == 3
+assert not any(f.done() for f in a + [b])
+
+while scheduler.step():
+    pass
+assert all(f.done() for f in a + [b])
+assert radio.written == [
+    packet(0x111111, 0x0100, 1), packet(0x222222, 0x0100, 7),
+    packet(0x111111, 0x0100, 1), packet(0x222222, 0x0100, 7),
+    packet(0x111111, 0x0100, 2), packet(0x222222, 0x0100, 7),
+    packet(0x111111, 0x0100, 2),
+]
+
+# With a scheduler, the Lightbar methods return futures right away
+radio = FakeRadio()
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.repetitions = 20
+with TxScheduler(radio, delay_s=0) as bar.scheduler:
+    future = bar.brightness(8)
+    timing = future.result(timeout=5)
+    assert timing.queued <= timing.started <= timing.done
+assert radio.written == 20*[packet(0xABCDEF, 0x04F0, 0)] + 20*[packet(0xABCDEF, 0x0408, 1)]
+
+# The asyncio controller yields between repetitions, several bars can overlap
+import asyncio
+from xiaomi_lightbar import AsyncLightbar
+
+radio = FakeRadio()
+bars = [AsyncLightbar(None, None, id, radio=radio) for id in (0x111111, 0x222222)]
+for bar in bars:
+    bar.repetitions = 2
+    bar.delay_s = 0
+
+
+async def toggle_all():
+    await asyncio.gather(*(bar.async_on_off() for bar in bars))
+
+asyncio.run(toggle_all())
+assert radio.written == 2*[packet(0x111111, 0x0100, 0), packet(0x222222, 0x0100, 0)]
+
+# With hopping, the packets of each round are grouped by channel
+from xiaomi_lightbar.policy import HopPattern
+
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0)
+hopping = HopPattern(channels=(15, 43))
+scheduler.submit(0x111111, packet(0x111111, 0x0100, 0), 3, hopping)
+scheduler.step()
+for id in (0x222222, 0x333333):
+    scheduler.submit(id, packet(id, 0x0100, 0), 2, hopping)
+while scheduler.step():
+    pass
+assert radio.channels == [15, 15, 15, 43, 43, 43, 15]
+
+# A bridge serves several bars with one radio, round-robin
+from xiaomi_lightbar.bridge import RadioBridge
+
+radio = FakeRadio()
+with RadioBridge(None, None, radio=radio, delay_s=0) as bridge:
+    bars = [bridge.lightbar(id) for id in (0x111111, 0x222222)]
+    assert bridge.lightbar(0x111111) is bars[0]
+    for bar in bars:
+        bar.repetitions = 2
+    futures = [bars[0].on_off(), bars[0].on_off(), bars[1].on_off()]
+    for future in futures:
+        future.result(timeout=5)
+assert radio.written.count(packet(0x111111, 0x0100, 1)) == 2
+assert radio.written.count(packet(0x222222, 0x0100, 0)) == 2
+
+# A batch of commands to many bars finishes in about one burst
+radio = FakeRadio()
+with RadioBridge(None, None, radio=radio, delay_s=0) as bridge:
+    for id in (0x111111, 0x222222, 0x333333):
+        bridge.lightbar(id).repetitions = 3
+    timings = bridge.send_batch([(0x111111, 0x0100), (0x222222, 0x0100, 9), (0x333333, 0x0401)])
+assert len(timings) == 3
+assert all(t.latency >= 0 for t in timings)
+assert radio.written[:3] == [packet(0x111111, 0x0100, 0), packet(0x222222, 0x0100, 9), packet(0x333333, 0x0401, 0)]
+assert radio.written[3:6] == radio.written[:3]
+
+# Priority classes: a toggle preempts a ramp between repetitions
+from xiaomi_lightbar.scheduler import AirtimeBudget, DeadlineExpired, INTERACTIVE, LEVEL, BACKGROUND
+from xiaomi_lightbar.policy import TX_SETTLING_S, airtime_s
+from xiaomi_lightbar.sim import VirtualClock
+
+ramp, toggle = packet(0x111111, 0x0401, 0), packet(0x222222, 0x0100, 0)
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0)
+scheduler.submit(0x111111, ramp, 4, priority=BACKGROUND)
+scheduler.step()
+scheduler.step()
+scheduler.submit(0x222222, toggle, 2, priority=INTERACTIVE)
+while scheduler.step():
+    pass
+assert radio.written == 2*[ramp] + 2*[toggle] + 2*[ramp]
+
+# Same remote: the toggle waits for the queued steps, in order, but the remote
+# gets its urgency meanwhile
+steps = [packet(0x111111, 0x0401, n) for n in (1, 2)]
+level = packet(0x333333, 0x04F0, 0)
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0)
+for pkt in steps:
+    scheduler.submit(0x111111, pkt, 2, priority=BACKGROUND)
+scheduler.step()
+scheduler.submit(0x333333, level, 1, priority=LEVEL)
+scheduler.submit(0x111111, packet(0x111111, 0x0100, 3), 1, priority=INTERACTIVE)
+while scheduler.step():
+    pass
+assert radio.written == 2*[steps[0]] + 2*[steps[1]] + [packet(0x111111, 0x0100, 3), level]
+
+# So the bar ends in the same state as with blocking sends, whatever the classes
+from xiaomi_lightbar.sim import SimulatedBar, SimulatedRadio
+
+clock = VirtualClock()
+radio = SimulatedRadio(clock)
+device = radio.add_bar(SimulatedBar(0x111111))
+bar = Lightbar(None, None, 0x111111, radio=radio)
+bar.track_state = True
+bar.repetitions = 3
+with TxScheduler(radio, delay_s=0.01, clock=clock) as bar.scheduler:
+    futures = [bar.brightness(10), bar.higher(2), bar.brightness(4), bar.reset(), bar.brightness(5)]
+    for future in futures:
+        future.result(timeout=5)
+assert [name for _, name, _ in device.log] == ["lower", "higher", "higher", "lower", "reset", "lower", "higher"]
+assert device.brightness == bar.levels["brightness"] == 5
+
+# A command not started before its deadline is dropped
+clock = VirtualClock()
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0.01, clock=clock)
+late = scheduler.submit(0x111111, ramp, 2, priority=BACKGROUND, deadline=0.005)
+clock.sleep(0.01)
+scheduler.step()
+assert isinstance(late.exception(), DeadlineExpired)
+assert radio.written == [] and scheduler.pending == 0
+
+# The airtime budget limits the duty cycle
+cost = TX_SETTLING_S + airtime_s()
+budget = AirtimeBudget(duty_cycle=0.02, burst_s=2*cost)
+clock = VirtualClock()
+radio = FakeRadio()
+scheduler = TxScheduler(radio, delay_s=0.01, clock=clock, budget=budget)
+for id in (0x111111, 0x222222, 0x333333):
+    scheduler.submit(id, packet(id, 0x0100, 0), 10)
+while scheduler.step():
+    clock.sleep(scheduler.delay_s)
+assert len(radio.written) == 30
+assert len(radio.written) * cost <= budget.duty_cycle * clock.monotonic() + budget.burst_s
+
+# Out of airtime, the remotes left waiting go first: they finish together
+clock = VirtualClock()
+scheduler = TxScheduler(FakeRadio(), delay_s=0.01, clock=clock, budget=AirtimeBudget(0.05, 2*cost))
+futures = [scheduler.submit(id, packet(id, 0x0100, 0), 10) for id in range(1, 7)]
+while scheduler.step():
+    clock.sleep(scheduler.delay_s)
+done = [future.result().done for future in futures]
+assert max(done) - min(done) < 0.1*max(done)
+
+# A budget shorter than one packet would never send anything
+try:
+    AirtimeBudget(duty_cycle=0.1, burst_s=cost/2)
+    assert False
+except ValueError:
+    pass
@@ -0,0 +1,40 @@
+from xiaomi_lightbar.policy import HopPattern, TX_SETTLING_S, airtime_s
+from xiaomi_lightbar.radio import Lightbar
+from xiaomi_lightbar.sim import SimulatedBar, SimulatedRadio
+
+# A lossless link, in virtual time
+radio = SimulatedRadio()
+device = radio.add_bar(SimulatedBar(0xABCDEF))
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.clock = radio.clock
+
+bar.on_off()
+assert device.is_on
+assert device.repeated == 19
+assert abs(radio.clock.monotonic() - 20*(bar.delay_s + TX_SETTLING_S + airtime_s())) < 1e-9
+
+bar.brightness(5)
+bar.color_temp(12)
+bar.lower(2)
+assert (device.brightness, device.color_temp) == (3, 12)
+
+# Repeated counters are rejected, other remotes ignored
+bar.on_off(counter=14)
+bar.on_off(counter=14)
+Lightbar(None, None, 0x111111, radio=radio).on_off()
+assert device.is_on is False
+
+# A noisy channel, and hopping to avoid it
+radio = SimulatedRadio(loss={6: 0.95}, seed=1)
+device = radio.add_bar(SimulatedBar(0xABCDEF))
+bar = Lightbar(None, None, 0xABCDEF, radio=radio)
+bar.clock = radio.clock
+bar.repetitions = 4
+for _ in range(10):
+    bar.on_off()
+assert len(device.log) < 10
+device.log.clear()
+bar.hopping = HopPattern(channels=(6, 43))
+for _ in range(10):
+    bar.on_off()
+assert len(device.log) == 10
@@ -0,0 +1,88 @@
+from xiaomi_lightbar.coalesce import Coalescer
+from xiaomi_lightbar.radio import Lightbar
+from xiaomi_lightbar.scheduler import TxScheduler
+from xiaomi_lightbar.sim import VirtualClock
+from xiaomi_lightbar.telemetry import Telemetry
+from fake_radio import FakeRadio
+
+
+class NackRadio(FakeRadio):
+    """Every write ends in MAX_RT, as with the real bar (no ACK)"""
+
+    def write(self, buf):
+        super().write(buf)
+        return False
+
+
+class FlakyRadio(FakeRadio):
+    """The third write raises"""
+
+    def write(self, buf):
+        if len(self.written) == 2:
+            raise OSError("SPI error")
+        return super().write(buf)
+
+
+# Blocking sends: packets, bursts and their duration. A write returning
+# False is not an error
+events = []
+telemetry = Telemetry()
+telemetry.add_sink(lambda *event: events.append(event))
+bar = Lightbar(None, None, 0xABCDEF, radio=NackRadio())
+bar.clock = VirtualClock()
+bar.repetitions = 6
+bar.delay_s = 0.01
+bar.telemetry = telemetry
+bar.on_off()
+bar.brightness(3)
+assert telemetry.counters[("packets", 0xABCDEF, "on_off")] == 6
+assert telemetry.total("write_errors") == 0
+assert telemetry.total("bursts") == 3
+assert telemetry.total("packets", 0xABCDEF) == 18
+assert telemetry.total("packets", 0x123456) == 0
+assert abs(telemetry.mean("burst_s") - 0.05) < 1e-9  # 5 delays between 6 packets
+assert telemetry.mean("queue_s") == 0
+assert events[0] == ("packets", 0xABCDEF, "on_off", 1)
+
+# Scheduled sends: the time waiting in the queue, and the cancelled commands
+telemetry = Telemetry()
+clock = VirtualClock()
+scheduler = TxScheduler(FakeRadio(), delay_s=0.01, clock=clock)
+scheduler.telemetry = telemetry
+bar = Lightbar(None, None, 0xABCDEF, radio=scheduler.radio)
+bar.repetitions = 2
+bar.scheduler = scheduler
+bar.on_off()
+clock.sleep(0.003)
+bar.on_off().cancel()
+while scheduler.step():
+    clock.sleep(scheduler.delay_s)
+assert telemetry.total("packets") == 2
+assert telemetry.total("dropped") == 1
+assert abs(telemetry.mean("queue_s") - 0.003) < 1e-9
+assert abs(telemetry.mean("burst_s") - 0.01) < 1e-9
+
+# Collapsed commands, and the Prometheus text
+coalescer = Coalescer(bar)
+coalescer.telemetry = telemetry
+coalescer.brightness(1)
+coalescer.brightness(2)
+assert telemetry.total("collapsed") == 1
+text = telemetry.prometheus()
+assert 'xiaomi_lightbar_packets_total{remote="abcdef",command="on_off"} 2' in text
+assert 'xiaomi_lightbar_queue_s_bucket{remote="abcdef",command="on_off",le="0.005"} 1' in text
+assert 'xiaomi_lightbar_burst_s_count{remote="abcdef",command="on_off"} 1' in text
+
+# A write that raises is an error
+telemetry = Telemetry()
+bar = Lightbar(None, None, 0xABCDEF, radio=FlakyRadio())
+bar.repetitions = 3
+bar.delay_s = 0
+bar.telemetry = telemetry
+try:
+    bar.on_off()
+    assert False
+except OSError:
+    pass
+assert telemetry.total("packets") == 3
+assert telemetry.counters[("write_errors", 0xABCDEF, "on_off")] == 1
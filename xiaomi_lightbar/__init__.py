@@ -1 +1,23 @@
-from .radio import Lightbar
+# The protocol modules (baseband, calibration, sim...) do not need the radio
+# hardware, and import fast. The controllers are imported on first use.
+
+_lazy = {
+    "Lightbar": ".radio",
+    "AsyncLightbar": ".aio",
+    "RadioBridge": ".bridge",
+}
+
+__all__ = list(_lazy)
+
+
+def __getattr__(name):
+    if name not in _lazy:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    import importlib
+    value = getattr(importlib.import_module(_lazy[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
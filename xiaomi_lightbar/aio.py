@@ -0,0 +1,66 @@
+import asyncio
+import contextlib
+from .radio import Lightbar
+from .scheduler import LEVEL
+
+
+class AsyncLightbar(Lightbar):
+    """Light bar controller for asyncio.
+
+    The async_* coroutines await asyncio.sleep between repetitions, instead of
+    blocking the thread (e.g. the event loop). With a scheduler, they await
+    its futures. They write each repetition, whatever fifo_burst.
+    """
+
+    async def async_send(self, code: int, counter: int = None, priority: int = None, deadline: float = None):
+        """Send a command to the Xiaomi light bar (see Lightbar.send)"""
+        if self.scheduler is not None:
+            await asyncio.wrap_future(self.send(code, counter, priority, deadline))
+            return
+        pkt = self.packet(code, self.next_counter(counter))
+        repetitions, delay_s = self.timing(code)
+        # Not from the TX FIFO: the bursts of concurrent bars are interleaved
+        with contextlib.closing(self.burst(pkt, repetitions, fifo=False)) as burst:
+            for _ in burst:
+                await asyncio.sleep(delay_s)
+
+    async def async_send_codes(self, codes: list, counter: int = None, priority: int = None,
+                               deadline: float = None):
+        """Send several commands in order (see Lightbar.send_codes)"""
+        for i, code in enumerate(codes):
+            await self.async_send(code, None if counter is None else counter+i, priority, deadline)
+
+    async def async_on_off(self, counter: int = None):
+        await self.async_send(0x0100, counter)
+
+    async def async_reset(self, counter: int = None):
+        await self.async_send(self._reset_code(), counter)
+
+    async def async_cooler(self, step: int = 1, counter: int = None):
+        await self.async_send(self._step_code("cooler", step), counter)
+
+    async def async_warmer(self, step: int = 1, counter: int = None):
+        await self.async_send(self._step_code("warmer", step), counter)
+
+    async def async_higher(self, step: int = 1, counter: int = None):
+        await self.async_send(self._step_code("higher", step), counter)
+
+    async def async_lower(self, step: int = 1, counter: int = None):
+        await self.async_send(self._step_code("lower", step), counter)
+
+    async def async_brightness(self, value: int, counter: int = None):
+        """Set the brightness (≤0 lowest, ≥15 highest 270 lm)"""
+        await self.async_send_codes(self._brightness_codes(value), counter, LEVEL)
+
+    async def async_color_temp(self, value: int, counter: int = None):
+        """Set the color temperature (≤0 ~2700K, ≥15 ~6500K)"""
+        await self.async_send_codes(self._color_temp_codes(value), counter, LEVEL)
+
+    async def async_set_levels(self, brightness: int = None, color_temp: int = None, counter: int = None):
+        """Set brightness and/or color temperature in one sequence of commands"""
+        codes = []
+        if brightness is not None:
+            codes += self._brightness_codes(brightness)
+        if color_temp is not None:
+            codes += self._color_temp_codes(color_temp)
+        await self.async_send_codes(codes, counter, LEVEL)
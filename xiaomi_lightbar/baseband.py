@@ -1,6 +1,5 @@
-import crc
-# https://github.com/Nicoretti/crc
-# `python -m pip install crc`
+import collections
+import functools
 
 # Structure of a packet (17 bytes)
 # - preamble (8 bytes), common to all devices, 0x533914DD1C493412
@@ -42,18 +41,114 @@ import crc
 # check=0x6e62 residue=0x0000  name=(none)
 # ```
 
+_command_names = {1: "on_off", 2: "cooler", 3: "cooler", 4: "higher", 5: "higher", 6: "reset"}
+_command_opposites = {"cooler": "warmer", "higher": "lower"}
+
+
+def parse_command(command: int) -> tuple:
+    """Decode a command code, return (name, step).
+
+    name: on_off, cooler, warmer, higher, lower, reset, or None if invalid.
+    step: signed change, 0 for on_off and reset. Steps > 15 saturate.
+    """
+    name = _command_names.get(command >> 8)
+    if name in ("on_off", "reset") or name is None:
+        return name, 0
+    step = command & 0xFF
+    if step >= 0x80:
+        return _command_opposites[name], step - 0x100
+    return name, step
+
+
 preamble = 0x533914DD1C493412  # 8 bytes, common to all devices
 separator = 0xFF
 
-crc16_config = crc.Configuration(
-    width=16,
-    polynomial=0x1021,
-    init_value=0xFFFE,
-    final_xor_value=0x0000,
-    reverse_input=False,
-    reverse_output=False,
-)
-crc16 = crc.Calculator(crc16_config)
+# CRC16 (see above), no reflection and no final xor
+crc16_polynomial = 0x1021
+crc16_init = 0xFFFE
+
+
+def _crc16_table(polynomial: int) -> tuple:
+    """CRC16 register update for each possible top byte (MSB first)"""
+    table = []
+    for byte in range(256):
+        reg = byte << 8
+        for _ in range(8):
+            reg = (reg << 1) ^ polynomial if reg & 0x8000 else reg << 1
+        table.append(reg & 0xFFFF)
+    return tuple(table)
+
+
+crc16_table = _crc16_table(crc16_polynomial)
+
+
+def crc16_update(reg: int, data: bytes) -> int:
+    """Feed some bytes into a CRC16 register, return the new register"""
+    table = crc16_table
+    for byte in data:
+        reg = ((reg << 8) & 0xFFFF) ^ table[(reg >> 8) ^ byte]
+    return reg
+
+
+def crc16_checksum(data: bytes) -> int:
+    """CRC16 of some bytes.
+
+    Before, baseband.crc16 was a crc.Calculator (crc16.checksum(data)) and
+    baseband.crc16_config its crc.Configuration. They are gone with the crc
+    dependency.
+    """
+    return crc16_update(crc16_init, data)
+
+
+def crc_ok(pkt: bytes) -> bool:
+    """Check the CRC16 of a packet"""
+    return crc16_update(crc16_init, pkt[:15]) == int.from_bytes(pkt[15:17], 'big')
+
+
+class PacketTemplate:
+    """Preallocated packet for one remote id.
+
+    The preamble, id and separator never change, so the CRC register after
+    those 12 bytes is computed once. Building a packet just patches the
+    counter, the command and the CRC (3 more table steps) in place.
+    """
+
+    def __init__(self, id: int):
+        self.id = id
+        self.buffer = bytearray(17)
+        self.buffer[0:8] = preamble.to_bytes(8, 'big')
+        self.buffer[8:11] = id.to_bytes(3, 'big')
+        self.buffer[11] = separator
+        self.crc = crc16_update(crc16_init, self.buffer[:12])
+
+    def build(self, command: int, counter: int, buf: bytearray = None) -> bytearray:
+        """Patch the packet in place and return the buffer.
+
+        By default the template's own buffer is patched and returned, so copy
+        it (e.g. bytes(...)) if it must outlive the next call. Pass a copy of
+        the template buffer as buf to use it from several threads.
+        """
+        if buf is None:
+            buf = self.buffer
+        table = crc16_table
+        hi = command >> 8
+        lo = command & 0xFF
+        buf[12] = counter
+        buf[13] = hi
+        buf[14] = lo
+        reg = self.crc
+        reg = ((reg << 8) & 0xFFFF) ^ table[(reg >> 8) ^ counter]
+        reg = ((reg << 8) & 0xFFFF) ^ table[(reg >> 8) ^ hi]
+        reg = ((reg << 8) & 0xFFFF) ^ table[(reg >> 8) ^ lo]
+        buf[15] = reg >> 8
+        buf[16] = reg & 0xFF
+        return buf
+
+
+@functools.lru_cache(maxsize=64)
+def template(id: int) -> PacketTemplate:
+    """Packet template of a remote id, shared by all the callers"""
+    return PacketTemplate(id)
 
 
 def packet(id: int, command: int, counter: int) -> bytes:
@@ -65,10 +160,53 @@ def packet(id: int, command: int, counter: int) -> bytes:
              Invalid codes are silently ignored by the bar.
     counter: int in range(0, 256), to reject repeated packets
     """
-    x = preamble.to_bytes(8, 'big')
-    x += id.to_bytes(3, 'big')
-    x += separator.to_bytes(1, 'big')
-    x += counter.to_bytes(1, 'big')
-    x += command.to_bytes(2, 'big')
-    x += crc16.checksum(x).to_bytes(2, 'big')
-    return x
+    t = template(id)
+    return bytes(t.build(command, counter, bytearray(t.buffer)))
+
+
+CacheInfo = collections.namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class PacketCache:
+    """LRU cache of complete packet sets.
+
+    For a (remote id, command) pair there are only 256 valid packets, one per
+    counter. They are built at once in a single contiguous block, and returned
+    as zero-copy memoryview slices.
+    """
+
+    def __init__(self, maxsize: int = 64):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._blocks = collections.OrderedDict()
+
+    def get(self, id: int, command: int, counter: int) -> memoryview:
+        """Packet for the remote id, command and counter (see packet)"""
+        if not 0 <= counter < 256:
+            raise ValueError("counter must be in range(0, 256)")
+        key = (id, command)
+        try:
+            block = self._blocks[key]
+        except KeyError:
+            self.misses += 1
+            block = self._blocks[key] = memoryview(self._build(id, command))
+            if len(self._blocks) > self.maxsize:
+                self._blocks.popitem(last=False)
+        else:
+            self.hits += 1
+            self._blocks.move_to_end(key)
+        return block[17*counter:17*counter + 17]
+
+    @staticmethod
+    def _build(id: int, command: int) -> bytes:
+        t = template(id)
+        buf = bytearray(t.buffer)
+        return b"".join([bytes(t.build(command, counter, buf)) for counter in range(256)])
+
+    def cache_info(self) -> CacheInfo:
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._blocks))
+
+    def cache_clear(self):
+        self._blocks.clear()
+        self.hits = self.misses = 0
@@ -0,0 +1,89 @@
+import time
+from .radio import Lightbar, open_radio
+from .scheduler import TxScheduler, command_priority
+
+
+class RadioBridge:
+    """One nRF24L01 module serving many light bars.
+
+    The radio is initialized once, and each light bar is a virtual remote
+    (remote id) with its own counter. All of them send through the same
+    transmit scheduler, round-robin: each round writes one packet to every
+    bar with pending commands.
+
+    Arguments:
+    ce_pin, csn_pin: pins of the nRF24L01 module
+    radio: an already configured radio (see radio.open_radio and
+           radio.RadioBackend). If given, the pins are not used.
+    delay_s: time between rounds of repetitions
+    clock: object with sleep(s) and monotonic() (the time module by default)
+    counter_store: optional counters.CounterStore, to resume the counters
+                   of the bars after a restart. It is not closed by the bridge.
+    telemetry: optional telemetry.Telemetry, shared by the scheduler and the bars
+    budget: optional scheduler.AirtimeBudget, limit of the time on the air
+    """
+
+    def __init__(self, ce_pin: int, csn_pin: int, radio=None, delay_s: float = 0.01, clock=time,
+                 counter_store=None, telemetry=None, budget=None):
+        self.radio = open_radio(ce_pin, csn_pin) if radio is None else radio
+        self.clock = clock
+        self.counter_store = counter_store
+        self.telemetry = telemetry
+        self.scheduler = TxScheduler(self.radio, delay_s, clock, budget)
+        self.scheduler.telemetry = telemetry
+        self.scheduler.start()
+        self.lightbars = {}  # remote id -> Lightbar
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def lightbar(self, remote_id: int, factory=Lightbar) -> Lightbar:
+        """Light bar of a remote id, created on first use.
+
+        factory: Lightbar class (e.g. AsyncLightbar), only used on creation
+        """
+        try:
+            return self.lightbars[remote_id]
+        except KeyError:
+            pass
+        bar = factory(None, None, remote_id, radio=self.radio)
+        bar.scheduler = self.scheduler
+        bar.clock = self.clock
+        bar.telemetry = self.telemetry
+        if self.counter_store is not None:
+            bar.counter_store = self.counter_store  # Resumes its counter
+        self.lightbars[remote_id] = bar
+        return bar
+
+    def send_batch(self, commands: list, timeout: float = None) -> list:
+        """Send commands to many bars in the same airtime window.
+
+        All the packets are built and queued at once, and their repetitions
+        are interleaved, so N bars take about the time of a single burst.
+        They share the priority class of the most urgent command.
+
+        commands: (remote_id, code) or (remote_id, code, counter) tuples
+        timeout: maximum wait, in seconds
+        Return the scheduler.Timing of each command, in the same order.
+        """
+        items = []
+        codes = []
+        for command in commands:
+            remote_id, code, counter = (tuple(command) + (None,))[:3]
+            bar = self.lightbar(remote_id)
+            repetitions, _ = bar.timing(code)
+            pkt = bar.packet(code, bar.next_counter(counter))
+            items.append((remote_id, pkt, repetitions, bar.hopping))
+            codes.append(code)
+        # All in the class of the most urgent one, or they would not share the rounds
+        priority = min(map(command_priority, codes), default=None)
+        items = [item + (priority,) for item in items]
+        futures = self.scheduler.submit_many(items)
+        return [future.result(timeout) for future in futures]
+
+    def close(self):
+        """Send the pending commands and stop the scheduler"""
+        self.scheduler.stop()
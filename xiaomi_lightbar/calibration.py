@@ -0,0 +1,89 @@
+import math
+
+# Calibration of the levels (0 to 15) of the bar, for the front ends that get
+# Home Assistant values: brightness 0-255, color temperature in mireds or
+# kelvin.
+#
+# The color temperature steps are not linear in mireds. Measured curve, as
+# (mireds, step) points: 6500K (153 mireds) is step 15, about 4570K (219
+# mireds) is step 7, and 2700K (370 mireds) is step 0. The brightness is
+# linear.
+#
+# The curves are turned into integer lookup tables once, so converting a value
+# is an index in a list, without float math. Values out of range are clamped.
+
+MIREDS_CURVE = ((153, 15), (219, 7), (370, 0))
+BRIGHTNESS_CURVE = ((0, 0), (255, 15))
+
+
+def interpolate(curve, x: float) -> float:
+    """Piecewise linear interpolation of a curve of (x, y) points, clamped at the ends"""
+    return _interpolate(sorted(curve), x)
+
+
+def _interpolate(points: list, x: float) -> float:
+    if x <= points[0][0]:
+        return points[0][1]
+    for (x0, y0), (x1, y1) in zip(points, points[1:]):
+        if x <= x1:
+            return y0 + (y1 - y0) * (x - x0) / (x1 - x0)
+    return points[-1][1]
+
+
+def _table(points: list, xs) -> list:
+    """Rounded interpolation at increasing xs, walking the segments once"""
+    table = []
+    i, last = 0, len(points) - 1
+    for x in xs:
+        while i < last and x > points[i + 1][0]:
+            i += 1
+        if i == last or x <= points[0][0]:
+            table.append(round(points[i][1]))
+            continue
+        (x0, y0), (x1, y1) = points[i], points[i + 1]
+        table.append(round(y0 + (y1 - y0) * (x - x0) / (x1 - x0)))
+    return table
+
+
+def _lookup(table: list, offset: int, value) -> int:
+    index = int(value) - offset
+    return table[min(max(index, 0), len(table) - 1)]
+
+
+class Calibration:
+    """Lookup tables from Home Assistant values to levels of the bar.
+
+    Arguments:
+    mireds_curve: (mireds, step) points of the color temperature
+    brightness_curve: (0-255 brightness, step) points of the brightness
+
+    A bar with a different response gets its own Calibration (see
+    Lightbar.calibration), the others share DEFAULT.
+    """
+
+    def __init__(self, mireds_curve=MIREDS_CURVE, brightness_curve=BRIGHTNESS_CURVE):
+        mireds_curve = sorted(mireds_curve)
+        brightness_curve = sorted(brightness_curve)
+        self.min_mireds = min(m for m, _ in mireds_curve)
+        self.max_mireds = max(m for m, _ in mireds_curve)
+        self.min_kelvin = math.ceil(1e6 / self.max_mireds)
+        self.max_kelvin = math.floor(1e6 / self.min_mireds)
+        self._mireds = _table(mireds_curve, range(self.min_mireds, self.max_mireds + 1))
+        self._kelvin = _table(mireds_curve, [1e6 / k for k in range(self.max_kelvin, self.min_kelvin - 1, -1)])
+        self._kelvin.reverse()
+        self._brightness = _table(brightness_curve, range(256))
+
+    def mireds(self, mireds: int) -> int:
+        """Color temperature level of a value in mireds"""
+        return _lookup(self._mireds, self.min_mireds, mireds)
+
+    def kelvin(self, kelvin: int) -> int:
+        """Color temperature level of a value in kelvin"""
+        return _lookup(self._kelvin, self.min_kelvin, kelvin)
+
+    def brightness(self, brightness: int) -> int:
+        """Brightness level of a 0-255 brightness"""
+        return _lookup(self._brightness, 0, brightness)
+
+
+DEFAULT = Calibration()
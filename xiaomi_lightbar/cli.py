@@ -0,0 +1,91 @@
+import argparse
+import socket
+import sys
+from .daemon import DEFAULT_SOCKET
+
+# xiaomi-lightbar command (console entry point)
+#
+#     xiaomi-lightbar serve --ce_pin 25 --csn_pin 0 --counter_file ~/.lightbar.counters
+#     xiaomi-lightbar send abcdef on_off
+#     xiaomi-lightbar send abcdef brightness 8
+#
+# serve owns the radio (see daemon.py), send is a thin client of its socket.
+# The client does not import the controllers, nor the radio driver.
+
+
+def send(path: str, lines: list) -> list:
+    """Send command lines to the daemon, return the replies"""
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall("".join(line + "\n" for line in lines).encode())
+        sock.shutdown(socket.SHUT_WR)
+        data = b""
+        while chunk := sock.recv(4096):
+            data += chunk
+    return data.decode().splitlines()
+
+
+def serve(args):
+    from .bridge import RadioBridge
+    from .counters import CounterStore
+    from .daemon import Daemon
+
+    counter_store = CounterStore(args.counter_file) if args.counter_file else None
+    bridge = RadioBridge(ce_pin=args.ce_pin, csn_pin=args.csn_pin, counter_store=counter_store)
+    try:
+        with Daemon(bridge, args.socket, args.track_state) as daemon:
+            print(f"Listening on {args.socket}")
+            daemon.serve_forever()
+    except OSError as e:
+        print(f"Cannot listen on {args.socket}: {e}", file=sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bridge.close()
+        if counter_store is not None:
+            counter_store.close()
+
+
+def send_command(args):
+    line = " ".join([args.remote_id, args.command] + ([args.argument] if args.argument else []))
+    try:
+        replies = send(args.socket, [line])
+    except OSError as e:
+        print(f"Cannot connect to {args.socket}: {e}", file=sys.stderr)
+        return 2
+    reply = replies[0] if replies else "error no reply"
+    if reply != "ok":
+        print(reply, file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="xiaomi-lightbar",
+                                     description="Control Xiaomi light bars through a nRF24L01 module.")
+    parser.add_argument("--socket", type=str, default=DEFAULT_SOCKET,
+                        help="Unix socket of the daemon, also $XIAOMI_LIGHTBAR_SOCKET (default: %(default)s)")
+    commands = parser.add_subparsers(dest="subcommand", required=True)
+
+    parser_serve = commands.add_parser("serve", help="Run the daemon, owning the radio")
+    parser_serve.add_argument("--ce_pin", type=int, default=25, help="CE Pin")
+    parser_serve.add_argument("--csn_pin", type=int, default=0, help="CSN Pin")
+    parser_serve.add_argument("--counter_file", type=str, default="", help="File to keep the counters between restarts")
+    parser_serve.add_argument("--track_state", action="store_true", help="Set levels with a single relative step when known")
+    parser_serve.set_defaults(func=serve)
+
+    parser_send = commands.add_parser("send", help="Send a command through the daemon")
+    parser_send.add_argument("remote_id", type=str, help="Remote ID (hex)")
+    parser_send.add_argument("command", type=str,
+                             help="on_off, reset, cooler, warmer, higher, lower, brightness, color_temp, "
+                                  "mireds, kelvin or code")
+    parser_send.add_argument("argument", type=str, nargs="?", default=None, help="Step, level, or value")
+    parser_send.set_defaults(func=send_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,143 @@
+import collections
+import logging
+import threading
+from concurrent.futures import Future
+
+_LOGGER = logging.getLogger(__name__)
+
+# Absolute targets (brightness, color temperature) supersede any pending target
+# of the same attribute, so only the latest one is sent. Toggles (on_off) and
+# relative steps do not commute, they are never dropped. A pending set_levels
+# (both attributes at once) is merged with the new one, the new values win.
+# A target never moves past a toggle: only the targets queued after the last
+# pending toggle are superseded, so a level asked for while the bar was lit is
+# sent while it is lit.
+
+ABSOLUTE = ("brightness", "color_temp")
+TOGGLES = ("on_off", "reset")
+
+
+class Coalescer:
+    """Queue of commands in front of a Lightbar, sent from a worker thread.
+
+    It has the same command methods as Lightbar, but they return right away.
+    A new brightness or color temperature drops the pending (not yet sent)
+    one queued after the last toggle, and goes to the end of the queue. The number of dropped commands is
+    counted in collapsed.
+    """
+
+    def __init__(self, lightbar):
+        self.lightbar = lightbar
+        self.collapsed = 0
+        self.telemetry = None  # Optional telemetry.Telemetry, counts the collapsed commands
+        self._queue = collections.deque()  # (method name, args)
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the worker thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="lightbar-coalescer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the worker thread, once the pending commands are sent"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    @property
+    def pending(self) -> int:
+        """Number of commands not sent yet"""
+        with self._cond:
+            return len(self._queue)
+
+    def put(self, name: str, *args):
+        """Queue a call to the Lightbar method name"""
+        with self._cond:
+            if name in ABSOLUTE or name == "set_levels":
+                for i in range(len(self._queue) - 1, -1, -1):
+                    op = self._queue[i]
+                    if op[0] in TOGGLES:
+                        break
+                    if op[0] == name:
+                        del self._queue[i]
+                        self._collapse(name)
+                        if name == "set_levels":
+                            args = tuple(old if new is None else new for old, new in zip(op[1], args))
+                        break
+            self._queue.append((name, args))
+            self._cond.notify()
+
+    def _collapse(self, name: str):
+        self.collapsed += 1
+        if self.telemetry is not None:
+            self.telemetry.count("collapsed", self.lightbar.id, name)
+
+    def step(self) -> bool:
+        """Send the first queued command, return False if there was none.
+
+        The worker thread calls it in a loop, but it can also be called
+        directly (e.g. in tests), without starting the thread.
+        """
+        with self._cond:
+            if not self._queue:
+                return False
+            name, args = self._queue.popleft()
+        try:
+            result = getattr(self.lightbar, name)(*args)
+            if isinstance(result, Future):  # Stay in front of the scheduler queue
+                result.result()
+        except Exception:
+            _LOGGER.exception("Lightbar %s%s failed", name, args)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queue:
+                    self._cond.wait()
+                if not self._queue:  # Stopped and nothing left
+                    return
+            self.step()
+
+    def on_off(self):
+        self.put("on_off")
+
+    def reset(self):
+        self.put("reset")
+
+    def cooler(self, step: int = 1):
+        self.put("cooler", step)
+
+    def warmer(self, step: int = 1):
+        self.put("warmer", step)
+
+    def higher(self, step: int = 1):
+        self.put("higher", step)
+
+    def lower(self, step: int = 1):
+        self.put("lower", step)
+
+    def brightness(self, value: int):
+        self.put("brightness", value)
+
+    def color_temp(self, value: int):
+        self.put("color_temp", value)
+
+    def set_levels(self, brightness: int = None, color_temp: int = None):
+        self.put("set_levels", brightness, color_temp)
@@ -0,0 +1,131 @@
+import os
+import struct
+import threading
+
+# Persistent sequence counters, keyed by remote id, so that a restart does not
+# reuse the counter of the last command (the bar would drop it as repeated).
+#
+# The file is append-only, a 4-byte record (remote id << 8 | counter) per
+# command, and the last record of each id wins. A torn record at the end
+# (crash while writing) is ignored. The file is compacted when opened, and
+# by the sync thread when it grows over compact_ratio records per id.
+#
+# The records are written without fsync. A background thread fsyncs them at
+# most every sync_interval_s, so the per-command path never waits for the
+# disk. After a crash, the last counters may be lost: that is why the store
+# resumes jump counters ahead of the stored one.
+
+RECORD = struct.Struct(">I")
+
+
+class CounterStore:
+    """Append-only file of the last counter of each remote id.
+
+    Arguments:
+    path: file name, created if it does not exist
+    jump: safety jump of the counters on load
+    sync_interval_s: maximum time between fsyncs
+    compact_ratio: records per remote id in the file before compacting it
+    """
+
+    def __init__(self, path: str, jump: int = 16, sync_interval_s: float = 5.0, compact_ratio: int = 256):
+        self.path = path
+        self.jump = jump
+        self.sync_interval_s = sync_interval_s
+        self.compact_ratio = compact_ratio
+        self.counters = self._read()
+        self._write_compacted(self.counters)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._records = len(self.counters)  # In the file
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._closed = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="lightbar-counters", daemon=True)
+        self._thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def _read(self) -> dict:
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return {}
+        counters = {}
+        size = len(data) - len(data) % RECORD.size  # Drop a torn record
+        for (record,) in RECORD.iter_unpack(data[:size]):
+            counters[record >> 8] = record & 0xFF
+        return counters
+
+    def _write_compacted(self, counters: dict, replace: bool = True) -> str:
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            for id, counter in counters.items():
+                f.write(RECORD.pack(id << 8 | counter))
+            f.flush()
+            os.fsync(f.fileno())
+        if replace:
+            os.replace(tmp, self.path)
+        return tmp
+
+    def compact(self):
+        """Rewrite the file with one record per remote id.
+
+        The new file is written and synced without the lock, so the updates
+        only wait for the swap. The records appended meanwhile are copied.
+        """
+        with self._lock:
+            snapshot = dict(self.counters)
+        tmp = self._write_compacted(snapshot, replace=False)
+        with self._lock:
+            fd = os.open(tmp, os.O_WRONLY | os.O_APPEND)
+            changed = {id: counter for id, counter in self.counters.items() if snapshot.get(id) != counter}
+            for id, counter in changed.items():
+                os.write(fd, RECORD.pack(id << 8 | counter))
+            os.replace(tmp, self.path)
+            os.close(self._fd)
+            self._fd = fd
+            self._records = len(self.counters)
+            self._dirty = self._dirty or bool(changed)
+
+    def load(self, remote_id: int) -> int:
+        """Counter to start with, for a remote id"""
+        if remote_id not in self.counters:
+            return 0
+        return (self.counters[remote_id] + self.jump) % 256
+
+    def update(self, remote_id: int, counter: int):
+        """Store the last counter used by a remote id (no fsync)"""
+        with self._lock:
+            self.counters[remote_id] = counter
+            os.write(self._fd, RECORD.pack(remote_id << 8 | counter))
+            self._records += 1
+            self._dirty = True
+
+    def sync(self):
+        """fsync the pending records, if any, and compact the file if too long"""
+        with self._lock:
+            dirty, self._dirty = self._dirty, False
+            fd = self._fd
+            long = self._records > self.compact_ratio * max(len(self.counters), 1)
+        if long:
+            self.compact()
+        elif dirty:
+            os.fsync(fd)
+
+    def _run(self):
+        while not self._closed.wait(self.sync_interval_s):
+            self.sync()
+
+    def close(self):
+        """Stop the sync thread, sync and close the file"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        self._thread.join()
+        self.sync()
+        os.close(self._fd)
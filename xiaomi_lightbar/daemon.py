@@ -0,0 +1,134 @@
+import logging
+import os
+import socket
+import socketserver
+import stat
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+# A long-running process owns the radio (one RadioBridge), and takes commands
+# from a Unix domain socket. The clients (shell hooks, cron jobs) do not open
+# the radio, and the counters are not reset on every call.
+#
+# Line protocol, one command per line, one reply per command:
+#
+#     <remote id, hex> <command> [<argument>]
+#
+#     abcdef on_off
+#     abcdef higher 2
+#     abcdef brightness 8
+#     abcdef kelvin 4000
+#     abcdef code 0x0401
+#
+# Commands: on_off, reset, cooler, warmer, higher, lower (optional step),
+# brightness, color_temp (level 0-15), mireds, kelvin (see calibration), and
+# code (raw command code). The reply is "ok" once the command is queued, or
+# "error <reason>". Several lines can be sent through the same connection,
+# e.g. `printf 'abcdef on_off\n' | nc -NU /tmp/xiaomi-lightbar.sock`
+
+DEFAULT_SOCKET = os.environ.get("XIAOMI_LIGHTBAR_SOCKET", "/tmp/xiaomi-lightbar.sock")
+
+STEPS = ("cooler", "warmer", "higher", "lower")
+LEVELS = ("brightness", "color_temp")
+
+
+class Daemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve the light bars of a RadioBridge through a Unix domain socket.
+
+    Arguments:
+    bridge: xiaomi_lightbar.RadioBridge, owning the radio
+    path: socket file, replaced if it is a stale socket (OSError if another
+          daemon listens on it, or if it is not a socket)
+    track_state: state tracking of the light bars (see Lightbar.track_state)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, bridge, path: str = DEFAULT_SOCKET, track_state: bool = False):
+        self.bridge = bridge
+        self.path = path
+        self.track_state = track_state
+        self._lock = threading.Lock()  # Counters and levels of the bars
+        remove_stale_socket(path)
+        super().__init__(path, _Handler)
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def lightbar(self, remote_id: int):
+        bar = self.bridge.lightbar(remote_id)
+        bar.track_state = self.track_state
+        return bar
+
+    def execute(self, line: str) -> str:
+        """Run a command line, return the reply"""
+        try:
+            return self._execute(line)
+        except Exception as e:
+            _LOGGER.exception("Command %r failed", line)
+            return f"error {type(e).__name__}: {e}"
+
+    def _execute(self, line: str) -> str:
+        words = line.split()
+        if not words:
+            return "error empty command"
+        if len(words) not in (2, 3):
+            return "error expected: <remote id> <command> [<argument>]"
+        try:
+            remote_id = int(words[0], 16)
+            argument = int(words[2], 0) if len(words) == 3 else None
+        except ValueError:
+            return "error invalid number"
+        if not 0 <= remote_id <= 0xFFFFFF:
+            return "error invalid remote id"
+        name = words[1]
+        with self._lock:
+            bar = self.lightbar(remote_id)
+            if name in ("on_off", "reset") and argument is None:
+                getattr(bar, name)()
+            elif name in STEPS:
+                getattr(bar, name)(1 if argument is None else argument)
+            elif argument is None:
+                return f"error {name} needs an argument"
+            elif name in LEVELS:
+                getattr(bar, name)(argument)
+            elif name == "mireds":
+                bar.color_temp(bar.calibration.mireds(argument))
+            elif name == "kelvin":
+                bar.color_temp(bar.calibration.kelvin(argument))
+            elif name == "code":
+                if not 0 <= argument <= 0xFFFF:
+                    return "error code out of range 0x0000-0xFFFF"
+                bar.send(argument)
+            else:
+                return f"error unknown command {name}"
+        return "ok"
+
+
+def remove_stale_socket(path: str):
+    """Remove a socket file left by a daemon that is gone"""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f"{path} exists and is not a socket")
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(path)
+        except ConnectionRefusedError:
+            os.unlink(path)
+            return
+    raise OSError(f"Another daemon is listening on {path}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        for line in self.rfile:
+            reply = self.server.execute(line.decode(errors="replace"))
+            self.wfile.write(reply.encode() + b"\n")
+            self.wfile.flush()
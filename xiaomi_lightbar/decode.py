@@ -0,0 +1,128 @@
+import collections
+import time
+import numpy as np
+from . import baseband
+
+# https://numpy.org
+# `python -m pip install numpy` (or xiaomi_lightbar_nrf24[decode])
+#
+# Decoder of the packets captured with a nRF24L01 (see radio.open_rx_radio).
+# The receiver address is the 5 first bytes of the preamble, so a capture
+# starts with the last bits of the preamble, followed by the 72 bits (9 bytes)
+# of the payload: remote id, separator, counter, command and CRC16. Then junk.
+# The payload usually starts at bit 15, but the receiver does not always lock
+# at the same bit, so all the shifts are tried, the expected one first. A
+# shift is good if the separator is 0xFF and the CRC16 is correct.
+#
+# The captures are decoded in batches, with numpy arrays of bits and a
+# table-driven CRC16 computed for all of them at once.
+
+PAYLOAD_BITS = 72
+EXPECTED_SHIFT = 15
+
+Packet = collections.namedtuple("Packet", ["id", "counter", "command", "shift"])
+
+_crc_table = np.array(baseband.crc16_table, dtype=np.uint16)
+_crc_preamble = baseband.crc16_update(baseband.crc16_init, baseband.preamble.to_bytes(8, "big"))
+
+
+def _shifts(n_bits: int) -> list:
+    """Possible bit offsets of the payload, the expected one first"""
+    return sorted(range(n_bits - PAYLOAD_BITS + 1), key=lambda s: abs(s - EXPECTED_SHIFT))
+
+
+def _crc_ok(payload: np.ndarray) -> np.ndarray:
+    """Check the CRC16 of (n, 9) payloads, after the preamble"""
+    reg = np.full(len(payload), _crc_preamble, dtype=np.uint16)
+    for col in range(7):
+        reg = (reg << 8) ^ _crc_table[(reg >> 8) ^ payload[:, col]]
+    return reg == (payload[:, 7].astype(np.uint16) << 8 | payload[:, 8])
+
+
+def decode(captures) -> list:
+    """Decode a batch of captures, return the good packets.
+
+    captures: sequence of captures (bytes, all the same length), or a 2-D
+              uint8 array, one capture per row
+    Return a list of Packet(id, counter, command, shift), in the same order
+    as the captures, without the ones that could not be decoded.
+    """
+    if not isinstance(captures, np.ndarray):
+        captures = [bytes(c) for c in captures]
+        if not captures:
+            return []
+        captures = np.frombuffer(b"".join(captures), dtype=np.uint8).reshape(len(captures), -1)
+    bits = np.unpackbits(captures, axis=1)
+    payloads = np.zeros((len(bits), PAYLOAD_BITS // 8), dtype=np.uint8)
+    shifts = np.full(len(bits), -1)
+
+    pending = np.arange(len(bits))
+    for shift in _shifts(bits.shape[1]):
+        payload = np.packbits(bits[pending, shift:shift + PAYLOAD_BITS], axis=1)
+        good = (payload[:, 3] == baseband.separator) & _crc_ok(payload)
+        payloads[pending[good]] = payload[good]
+        shifts[pending[good]] = shift
+        pending = pending[~good]
+        if len(pending) == 0:
+            break
+
+    found = np.flatnonzero(shifts >= 0)
+    p = payloads[found].astype(np.uint32)
+    ids = p[:, 0] << 16 | p[:, 1] << 8 | p[:, 2]
+    commands = p[:, 5] << 8 | p[:, 6]
+    return [Packet(*values) for values in zip(ids.tolist(), p[:, 4].tolist(), commands.tolist(),
+                                              shifts[found].tolist())]
+
+
+class StreamDecoder:
+    """Drain the RX FIFO of a radio, and decode the captures in batches.
+
+    Repeated packets (same remote id and counter) are reported once.
+
+    Arguments:
+    radio: a listening radio, e.g. from radio.open_rx_radio
+    batch: captures decoded at once, at most
+    poll_s: wait when the FIFO is empty
+    window: (id, counter) pairs remembered to drop the repeated packets
+    """
+
+    def __init__(self, radio, batch: int = 64, poll_s: float = 0.0005, window: int = 1024):
+        self.radio = radio
+        self.batch = batch
+        self.poll_s = poll_s
+        self.window = window
+        self.captures = 0
+        self.decoded = 0
+        self._seen = collections.OrderedDict()
+
+    def drain(self) -> list:
+        """Read the captures available in the FIFO, up to batch"""
+        captures = []
+        while len(captures) < self.batch and self.radio.available():
+            captures.append(self.radio.read(self.radio.payload_size))
+        self.captures += len(captures)
+        return captures
+
+    def new_packets(self, captures) -> list:
+        """Decode captures, return the packets not seen before"""
+        packets = []
+        for pkt in decode(captures):
+            self.decoded += 1
+            key = (pkt.id, pkt.counter)
+            if key in self._seen:
+                self._seen.move_to_end(key)
+                continue
+            self._seen[key] = None
+            if len(self._seen) > self.window:
+                self._seen.popitem(last=False)
+            packets.append(pkt)
+        return packets
+
+    def __iter__(self):
+        """Yield new packets forever"""
+        while True:
+            captures = self.drain()
+            if captures:
+                yield from self.new_packets(captures)
+            else:
+                time.sleep(self.poll_s)
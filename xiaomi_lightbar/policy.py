@@ -0,0 +1,175 @@
+import math
+from . import baseband
+
+# The bar drops the corrupted packets and the repeated ones (same counter), so
+# a command is lost only if all its repetitions are lost. With a packet loss
+# probability p, n repetitions fail with probability p**n, and the required
+# repetitions for a success probability s are n = log(1 - s) / log(p).
+#
+# The target success probability depends on the kind of command:
+# - toggle (on_off, reset): a lost on_off inverts the state until the next one.
+# - step (relative changes): a lost step leaves a wrong level.
+# - saturate (out-of-range steps): absolute commands, idempotent, re-asserting
+#   the level fixes a lost one.
+
+TARGETS = {"toggle": 0.9999, "step": 0.999, "saturate": 0.99}
+
+
+def command_kind(code: int) -> str:
+    """toggle, step or saturate"""
+    name, step = baseband.parse_command(code)
+    if name in ("on_off", "reset") or name is None:
+        return "toggle"
+    return "saturate" if abs(step) > 15 else "step"
+
+
+class TxPolicy:
+    """Repetitions and delay between them, for each command.
+
+    The repetitions are computed from the packet loss probability, measured
+    on site with a receiver close to the bar (see record), or a prior guess
+    (loss) without measurements.
+
+    Arguments:
+    loss: packet loss probability, before any measurement
+    delay_s: time between repetitions
+    targets: success probability of each kind of command (see TARGETS)
+    min_repetitions, max_repetitions: limits of the repetitions
+    """
+
+    def __init__(self, loss: float = 0.5, delay_s: float = 0.01, targets: dict = None,
+                 min_repetitions: int = 2, max_repetitions: int = 40):
+        self.prior_loss = loss
+        self.delay_s = delay_s
+        self.targets = dict(TARGETS, **(targets or {}))
+        self.min_repetitions = min_repetitions
+        self.max_repetitions = max_repetitions
+        self.sent = 0
+        self.received = 0
+        self._repetitions = {}
+
+    @classmethod
+    def from_measurement(cls, sent: int, received: int, **kwargs):
+        """Policy for a measured number of sent and received packets"""
+        policy = cls(**kwargs)
+        policy.record(sent, received)
+        return policy
+
+    def record(self, sent: int, received: int):
+        """Add a measurement: received packets out of sent ones"""
+        self.sent += sent
+        self.received += received
+        self._repetitions.clear()
+
+    @property
+    def loss(self) -> float:
+        """Estimated packet loss probability"""
+        if self.sent == 0:
+            loss = self.prior_loss
+        else:  # Laplace rule of succession, never 0 or 1
+            loss = (self.sent - self.received + 1) / (self.sent + 2)
+        return min(max(loss, 1e-3), 0.999)
+
+    def repetitions(self, code: int) -> int:
+        """Repetitions for a command code"""
+        kind = command_kind(code)
+        try:
+            return self._repetitions[kind]
+        except KeyError:
+            n = math.ceil(math.log(1 - self.targets[kind]) / math.log(self.loss))
+            n = min(max(n, self.min_repetitions), self.max_repetitions)
+            self._repetitions[kind] = n
+            return n
+
+
+# A nRF24L01 packet on the air (Enhanced ShockBurst) is
+# - preamble (1 byte)
+# - address (3 to 5 bytes), here the sync sequence 0x5555555555
+# - packet control field (9 bits)
+# - payload, the 17 bytes of the light bar packet
+# - CRC (1 or 2 bytes)
+# Before each packet, the PLL settles for 130 µs (standby to TX mode).
+
+TX_SETTLING_S = 130e-6
+
+
+def airtime_s(payload_size: int = 17, address_width: int = 5, crc_length: int = 2,
+              bitrate: float = 2e6) -> float:
+    """Time on the air of a nRF24L01 packet, without the settling time"""
+    bits = 8*(1 + address_width + payload_size + crc_length) + 9
+    return bits / bitrate
+
+
+# The bar listens on several channels (or +1), the original remote hops
+# between them, sending the same packet on each one.
+CHANNELS = (6, 15, 43, 68)
+
+
+class ChannelStats:
+    """Success rate and latency statistics of each channel.
+
+    The success rate comes from a receiver close to the bar (record). The
+    writes (record_write) only give their count and latency: the bar never
+    acknowledges, so the return value of a write says nothing about the
+    delivery (see radio.open_radio).
+    """
+
+    def __init__(self):
+        self.attempts = {}  # Packets checked by a receiver
+        self.successes = {}
+        self.writes = {}
+        self.latency_s = {}  # Total of the recorded latencies
+        self.latencies = {}  # Number of recorded latencies
+
+    def record(self, channel: int, ok: bool, latency_s: float = None):
+        """Record a packet sent, and whether a receiver saw it"""
+        self.attempts[channel] = self.attempts.get(channel, 0) + 1
+        self.successes[channel] = self.successes.get(channel, 0) + bool(ok)
+        self._latency(channel, latency_s)
+
+    def record_write(self, channel: int, latency_s: float = None):
+        """Record a packet written, delivered or not"""
+        self.writes[channel] = self.writes.get(channel, 0) + 1
+        self._latency(channel, latency_s)
+
+    def _latency(self, channel: int, latency_s: float):
+        if latency_s is not None:
+            self.latency_s[channel] = self.latency_s.get(channel, 0.0) + latency_s
+            self.latencies[channel] = self.latencies.get(channel, 0) + 1
+
+    def success_rate(self, channel: int) -> float:
+        attempts = self.attempts.get(channel, 0)
+        return self.successes[channel] / attempts if attempts else None
+
+    def mean_latency_s(self, channel: int) -> float:
+        n = self.latencies.get(channel, 0)
+        return self.latency_s[channel] / n if n else None
+
+    def summary(self) -> dict:
+        """{channel: {attempts, writes, success_rate, mean_latency_s}}"""
+        return {channel: {"attempts": self.attempts.get(channel, 0),
+                          "writes": self.writes.get(channel, 0),
+                          "success_rate": self.success_rate(channel),
+                          "mean_latency_s": self.mean_latency_s(channel)}
+                for channel in sorted(self.attempts.keys() | self.writes.keys())}
+
+
+class HopPattern:
+    """Channels for the repetitions of a command.
+
+    The channel changes between repetitions, while waiting anyway for the
+    next one, so hopping costs no extra time.
+
+    Arguments:
+    channels: sequence of channels, cycled
+    dwell: consecutive repetitions on each channel
+    """
+
+    def __init__(self, channels: tuple = CHANNELS, dwell: int = 1):
+        self.channels = tuple(channels)
+        self.dwell = dwell
+        self.stats = ChannelStats()
+
+    def channel(self, repetition: int) -> int:
+        """Channel of a repetition (0, 1, ...)"""
+        return self.channels[(repetition // self.dwell) % len(self.channels)]
@@ -1,9 +1,29 @@
+import contextlib
+import threading
 import time
-import pyrf24
-from . import baseband
+import typing
+from concurrent.futures import Future
+from . import baseband, calibration, telemetry
+from .scheduler import LEVEL, command_priority
 
 # https://nrf24.github.io/RF24/
 # https://pyrf24.readthedocs.io/en/latest/rf24_api.html
+#
+# pyrf24 (a native extension) is imported when a radio is opened, so the
+# library can be used without it (e.g. with a simulated radio).
+
+
+class RadioBackend(typing.Protocol):
+    """What the light bar controllers need from a radio.
+
+    Implemented by pyrf24.RF24 (configured by open_radio) and by
+    sim.SimulatedRadio, for tests and benchmarks without hardware.
+    """
+
+    channel: int
+
+    def write(self, buf) -> bool:
+        """Transmit a packet"""
 
 
 def clamp(x: int):
@@ -11,84 +31,340 @@ def clamp(x: int):
     return min(max(x, 0), 15)
 
 
+# Relative steps: tracked level, base code, direction
+STEP_CODES = {
+    "cooler": ("color_temp", 0x0200, 1),
+    "warmer": ("color_temp", 0x0300, -1),
+    "higher": ("brightness", 0x0400, 1),
+    "lower": ("brightness", 0x0500, -1),
+}
+
+
+def has_fifo_reuse(radio) -> bool:
+    """True if the radio can repeat a payload from its TX FIFO (pyrf24.RF24)"""
+    return all(hasattr(radio, name) for name in ("write_fast", "reuse_tx", "tx_standby", "flush_tx"))
+
+
+# The TX FIFO holds the payload of a burst until its end, so the FIFO bursts
+# on the same radio (from several threads) go one after the other.
+_fifo_locks = {}  # id(radio) -> threading.Lock
+_fifo_locks_lock = threading.Lock()
+
+
+def _fifo_lock(radio) -> threading.Lock:
+    with _fifo_locks_lock:
+        return _fifo_locks.setdefault(id(radio), threading.Lock())
+
+
+def open_rx_radio(ce_pin: int, csn_pin: int, channel: int = 6):
+    """Initialize a nRF24L01 module to capture the packets to the light bars.
+
+    The address is the 5 first bytes of the preamble, and each capture is 12
+    bytes long, more than necessary (see scripts/scan_lightbar_remote.py).
+    """
+    import pyrf24
+    radio = pyrf24.RF24()
+    if not radio.begin(ce_pin, csn_pin):
+        raise OSError("nRF24L01 hardware is not responding")
+    radio.channel = channel
+    radio.pa_level = pyrf24.RF24_PA_LOW
+    radio.data_rate = pyrf24.RF24_2MBPS
+    radio.dynamic_payloads = False
+    radio.crc_length = pyrf24.RF24_CRC_DISABLED
+    radio.payload_size = 12  # More than necessary, strip some bits
+    radio.address_width = 5
+    radio.listen = True
+    radio.open_rx_pipe(1, baseband.preamble >> 24)  # 5 first bytes of preamble
+    return radio
+
+
+def open_radio(ce_pin: int, csn_pin: int):
+    """Initialize a nRF24L01 module to transmit to the light bars"""
+    import pyrf24
+    radio = pyrf24.RF24()
+    if not radio.begin(ce_pin, csn_pin):
+        raise OSError("nRF24L01 hardware is not responding")
+    radio.channel = 6  # 6, 15, 43, 68 (or +1) -> 2406 MHz, 2015 MHz, 2043 MHz, 2068 MHz
+    radio.pa_level = pyrf24.RF24_PA_LOW
+    radio.data_rate = pyrf24.RF24_2MBPS
+    # No retries, the repetitions are done manually in method send. Auto-ack
+    # stays on, and the bar never acknowledges: every write ends in MAX_RT
+    # and returns False, which is not an error.
+    radio.set_retries(0, 0)
+    radio.listen = False
+    radio.dynamic_payloads = False
+    radio.payload_size = 17
+    radio.open_tx_pipe(bytes(5*[0x55]))  # Address, really sync sequence
+    return radio
+
+
 class Lightbar:
     """Implements a Xiaomi light bar controller with a nRF24L01 module"""
 
-    def __init__(self, ce_pin: int, csn_pin: int, remote_id: int):
-        self.radio = pyrf24.RF24()
-        if not self.radio.begin(ce_pin, csn_pin):
-            raise OSError("nRF24L01 hardware is not responding")
-        self.radio.channel = 6  # 6, 15, 43, 68 (or +1) -> 2406 MHz, 2015 MHz, 2043 MHz, 2068 MHz
-        self.radio.pa_level = pyrf24.RF24_PA_LOW
-        self.radio.data_rate = pyrf24.RF24_2MBPS
-        self.radio.set_retries(0, 0)  # no repetitions, done manually in method send
-        self.radio.listen = False
-        self.radio.dynamic_payloads = False
-        self.radio.payload_size = 17
-        self.radio.open_tx_pipe(bytes(5*[0x55]))  # Address, really sync sequence
+    def __init__(self, ce_pin: int, csn_pin: int, remote_id: int, radio=None):
+        """Arguments:
+        ce_pin, csn_pin: pins of the nRF24L01 module
+        remote_id: Xiaomi remote id, 3-byte int (0x112233)
+        radio: an already configured radio (see open_radio and RadioBackend).
+               If given, the pins are not used.
+        """
+        self.radio = open_radio(ce_pin, csn_pin) if radio is None else radio
         self.repetitions = 20
         self.delay_s = 0.01
         self.counter = 0
         self.id = remote_id  # Xiaomi remote id, 3-byte int (0x112233)
+        self.cache = None  # Optional baseband.PacketCache, shared or not
+        self.scheduler = None  # Optional scheduler.TxScheduler, owning the radio
+        self.policy = None  # Optional policy.TxPolicy, instead of repetitions and delay_s
+        self.hopping = None  # Optional policy.HopPattern, instead of a fixed channel
+        self.clock = time  # sleep() and monotonic(), e.g. sim.VirtualClock
+        self.counter_store = None  # Optional counters.CounterStore, to persist the counter (see below)
+        self.calibration = calibration.DEFAULT  # Home Assistant values to levels (front ends)
+        self.telemetry = None  # Optional telemetry.Telemetry, counters and latencies
+        self.fifo_burst = False  # Repeat the payload in the TX FIFO, if the radio can (see burst)
+        # State tracking: remember the levels, to change them with a single
+        # relative step instead of saturating and adjusting (two commands).
+        # Saturate anyway when unknown, and every resync_every changes.
+        self.track_state = False
+        self.resync_every = 16
+        self.levels = {"brightness": None, "color_temp": None}  # 0 to 15
+        self._changes = {"brightness": 0, "color_temp": 0}
+
+    @property
+    def counter_store(self):
+        """Optional counters.CounterStore. Attaching one resumes the counter of the remote id"""
+        return self._counter_store
 
-    def send(self, code: int, counter: int = None):
+    @counter_store.setter
+    def counter_store(self, store):
+        self._counter_store = store
+        if store is not None:
+            self.counter = store.load(self.id)
+
+    def packet(self, code: int, counter: int):
+        """Packet for a command, from the cache if there is one"""
+        if self.cache is None:
+            return baseband.packet(self.id, code, counter)
+        return self.cache.get(self.id, code, counter)
+
+    def next_counter(self, counter: int = None) -> int:
+        """Return counter, or the internal counter (incrementing it) if None"""
+        if counter is None:
+            counter = self.counter
+            self.counter += 1
+            if self.counter > 255:
+                self.counter = 0
+            if self.counter_store is not None:
+                self.counter_store.update(self.id, counter)
+        return counter
+
+    def timing(self, code: int) -> tuple:
+        """Repetitions and delay between them for a command code"""
+        if self.policy is None:
+            return self.repetitions, self.delay_s
+        return self.policy.repetitions(code), self.policy.delay_s
+
+    def send(self, code: int, counter: int = None, priority: int = None, deadline: float = None):
         """Send a command to the Xiaomi light bar.
 
         Arguments:
         code: 2 byte int (e.g. 0x0100)
         counter: int in range(0, 256) to reject repeated packets.
                  If None, use an internal counter that increments one.
+        priority, deadline: see scheduler.TxScheduler.submit. By default,
+                 toggles are interactive, and steps background.
+
+        Without a scheduler, block until all the repetitions are sent.
+        With a scheduler, queue the packet and return right away a
+        concurrent.futures.Future, done when the packet is sent.
         """
-        if counter is None:
-            counter = self.counter
-            self.counter += 1
-            if self.counter > 255:
-                self.counter = 0
-        pkt = baseband.packet(self.id, code, counter)
-        for _ in range(self.repetitions):
-            self.radio.write(pkt)
-            time.sleep(self.delay_s)
+        pkt = self.packet(code, self.next_counter(counter))
+        repetitions, delay_s = self.timing(code)
+        if self.scheduler is not None:
+            if priority is None:
+                priority = command_priority(code)
+            return self.scheduler.submit(self.id, pkt, repetitions, self.hopping, priority, deadline)
+        with contextlib.closing(self.burst(pkt, repetitions)) as burst:  # Closed if interrupted
+            for _ in burst:
+                self.clock.sleep(delay_s)
+
+    def burst(self, pkt, repetitions: int, fifo: bool = None):
+        """Write the repetitions of a packet, yielding after each one.
+
+        The caller waits between repetitions (clock.sleep, asyncio.sleep...),
+        and closes the generator if it stops before the end.
+        With hopping, the channel changes before the write, if needed.
+        Without hopping, if fifo (fifo_burst by default) and the radio can,
+        the payload is loaded once and repeated from the TX FIFO. Opt-in: the
+        burst needs the FIFO for itself until its end, so no other writes to
+        the radio meanwhile (scheduler, asyncio sends, other threads); the
+        FIFO bursts of several bars are serialized.
+        """
+        hopping = self.hopping
+        fifo = self.fifo_burst if fifo is None else fifo
+        if hopping is None and fifo and has_fifo_reuse(self.radio):
+            yield from self._fifo_burst(pkt, repetitions)
+            return
+        stats = self.telemetry
+        if hopping is None and stats is None:
+            for _ in range(repetitions):
+                self.radio.write(pkt)
+                yield
+            return
+        if stats is not None:
+            command = telemetry.command_name(pkt)
+            started = self.clock.monotonic()
+        channel = None
+        for i in range(repetitions):
+            if hopping is not None and hopping.channel(i) != channel:
+                channel = hopping.channel(i)
+                self.radio.channel = channel
+            start = self.clock.monotonic()
+            try:
+                self.radio.write(pkt)  # False on MAX_RT, i.e. always (see open_radio)
+            except Exception:
+                if stats is not None:
+                    stats.write(self.id, command, error=True)
+                raise
+            if hopping is not None:
+                hopping.stats.record_write(channel, self.clock.monotonic() - start)
+            if stats is not None:
+                stats.write(self.id, command)
+                if i == repetitions - 1:  # No queue: queued when started
+                    stats.burst(self.id, command, started, started, self.clock.monotonic())
+            yield
+
+    def _fifo_burst(self, pkt, repetitions: int):
+        """Load the payload in the TX FIFO once, and transmit it again with reuse_tx.
+
+        There is no SPI transfer of the payload after the first repetition,
+        just the reuse command. No ACK comes back and there are no retries
+        (see open_radio), so the radio stops after each transmission (MAX_RT)
+        until reuse_tx. tx_standby waits for the last one, drops the payload
+        and leaves TX mode. Not tx_standby(timeout): on MAX_RT, it reuses the
+        payload again until the timeout, adding packets.
+
+        If the burst stops early (closed, or an error), the FIFO is flushed
+        and the radio left in standby, or the next burst would send the old
+        payload.
+        """
+        stats = self.telemetry
+        if stats is not None:
+            command = telemetry.command_name(pkt)
+            started = self.clock.monotonic()
+        radio = self.radio
+        with _fifo_lock(radio):
+            done = False
+            try:
+                for i in range(repetitions):
+                    try:
+                        if i == 0:
+                            radio.write_fast(pkt)
+                        else:
+                            radio.reuse_tx()
+                        if i == repetitions - 1:
+                            radio.tx_standby()
+                            done = True
+                    except Exception:
+                        if stats is not None:
+                            stats.write(self.id, command, error=True)
+                        raise
+                    if stats is not None:
+                        stats.write(self.id, command)
+                        if i == repetitions - 1:
+                            stats.burst(self.id, command, started, started, self.clock.monotonic())
+                    yield
+            finally:
+                if not done and repetitions > 0:
+                    radio.flush_tx()
+                    radio.tx_standby()
 
     @property
     def is_available(self):
         return self.radio.is_chip_connected
 
+    def _move(self, level: str, step: int):
+        """Track a relative change of a level"""
+        if self.levels[level] is not None:
+            self.levels[level] = clamp(self.levels[level] + step)
+
+    def _step_code(self, name: str, step: int) -> int:
+        """Code of a relative step (see STEP_CODES), tracking its level"""
+        level, base, direction = STEP_CODES[name]
+        self._move(level, direction*clamp(step))
+        return base + direction*clamp(step)
+
+    def _reset_code(self) -> int:
+        """Code of reset, forgetting the tracked levels"""
+        self.levels = {"brightness": None, "color_temp": None}
+        return 0x0600
+
     def on_off(self, counter: int = None):
-        self.send(0x0100, counter)
+        return self.send(0x0100, counter)
 
     def reset(self, counter: int = None):
-        self.send(0x0600, counter)
+        return self.send(self._reset_code(), counter)
 
     def cooler(self, step: int = 1, counter: int = None):
-        self.send(0x0200 + clamp(step), counter)
+        return self.send(self._step_code("cooler", step), counter)
 
     def warmer(self, step: int = 1, counter: int = None):
-        self.send(0x0300 - clamp(step), counter)
+        return self.send(self._step_code("warmer", step), counter)
 
     def higher(self, step: int = 1, counter: int = None):
-        self.send(0x0400 + clamp(step), counter)
+        return self.send(self._step_code("higher", step), counter)
 
     def lower(self, step: int = 1, counter: int = None):
-        self.send(0x0500 - clamp(step), counter)
+        return self.send(self._step_code("lower", step), counter)
 
-    def brightness(self, value: int, counter: int = None):
-        """Set the brightness (≤0 lowest, ≥15 highest 270 lm)"""
+    def send_codes(self, codes: list, counter: int = None, priority: int = None, deadline: float = None):
+        """Send several commands in order, return the result of the last one.
 
-        # Beware, counter increases by two, two operations
-        counter2 = None if counter is None else counter+1
+        Beware, counter increases by one for each command.
+        """
+        result = None
+        if not codes and self.scheduler is not None:
+            result = Future()
+            result.set_result(None)
+        for i, code in enumerate(codes):
+            result = self.send(code, None if counter is None else counter+i, priority, deadline)
+        return result
 
-        # Saturate lowest sending an out-of-range step >15.
-        # This delays the change until next update! Then adjust.
-        self.send(0x0500-16, counter)
-        self.higher(value, counter2)
+    def _level_codes(self, level: str, value: int, up: int, down: int) -> list:
+        """Commands to set a level, with up + step and down - step codes"""
+        value = clamp(value)
+        known = self.levels[level]
+        if self.track_state and known is not None and self._changes[level] < self.resync_every:
+            self._changes[level] += 1
+            step = value - known
+            codes = [up + step] if step > 0 else [down + step] if step < 0 else []
+        else:
+            # Saturate lowest sending an out-of-range step >15.
+            # This delays the change until next update! Then adjust.
+            self._changes[level] = 0
+            codes = [down - 16, up + value]
+        self.levels[level] = value
+        return codes
+
+    def _brightness_codes(self, value: int) -> list:
+        return self._level_codes("brightness", value, 0x0400, 0x0500)
+
+    def _color_temp_codes(self, value: int) -> list:
+        return self._level_codes("color_temp", value, 0x0200, 0x0300)
+
+    def brightness(self, value: int, counter: int = None):
+        """Set the brightness (≤0 lowest, ≥15 highest 270 lm)"""
+        return self.send_codes(self._brightness_codes(value), counter, LEVEL)
 
     def color_temp(self, value: int, counter: int = None):
         """Set the color temperature (≤0 ~2700K, ≥15 ~6500K)"""
+        return self.send_codes(self._color_temp_codes(value), counter, LEVEL)
 
-        # Beware, counter increases by two, two operations
-        counter2 = None if counter is None else counter+1
-
-        # Saturate warmest sending an out-of-range step >15.
-        # This delays the change until next update! Then adjust.
-        self.send(0x0300-16, counter)
-        self.cooler(value, counter2)
+    def set_levels(self, brightness: int = None, color_temp: int = None, counter: int = None):
+        """Set brightness and/or color temperature in one sequence of commands"""
+        codes = []
+        if brightness is not None:
+            codes += self._brightness_codes(brightness)
+        if color_temp is not None:
+            codes += self._color_temp_codes(color_temp)
+        return self.send_codes(codes, counter, LEVEL)
@@ -0,0 +1,292 @@
+import collections
+import threading
+import time
+from concurrent.futures import Future
+from . import baseband
+from .policy import TX_SETTLING_S, airtime_s
+from .telemetry import command_name
+
+# A transmit scheduler owns the radio and a queue of pending commands. Instead
+# of sending the repetitions of one command after another, each round writes
+# one packet of the first pending command of every remote, and then waits.
+# Therefore, N bars receive their commands in about the time of one burst.
+#
+# Commands to the same remote are not interleaved, they keep their order: the
+# bar would take the alternating counters as new commands.
+#
+# With frequency hopping, the packets of a round are grouped by channel, so
+# the channel changes as few times as possible.
+#
+# Priority classes: interactive (on_off, reset) > level (brightness, color
+# temperature) > background (relative steps, e.g. ramps). A round only writes
+# the packets of the most urgent class pending, so the others are preempted
+# between repetitions. The queue of each remote stays in order, whatever the
+# classes: reset and the relative steps do not commute, so reordering them
+# would change the final state of the bar (and break the state tracking).
+# Instead, a remote with an urgent command queued behind others gets its
+# urgency, so the commands ahead of it are not preempted by other remotes.
+#
+# A deadline drops a command not started by then (e.g. a stale ramp step).
+# An optional airtime budget (token bucket) limits the time on the air, so
+# the shared 2.4 GHz band is never saturated: the packets above it wait for
+# the next rounds, and the remotes left waiting go first then.
+
+INTERACTIVE, LEVEL, BACKGROUND = 0, 1, 2
+
+
+def command_priority(code: int) -> int:
+    """Default class of a command: toggles are interactive, steps background"""
+    name, _ = baseband.parse_command(code)
+    return INTERACTIVE if name in ("on_off", "reset") or name is None else BACKGROUND
+
+
+class DeadlineExpired(Exception):
+    """The command was not started before its deadline"""
+
+
+class AirtimeBudget:
+    """Token bucket of airtime.
+
+    Arguments:
+    duty_cycle: fraction of the time on the air, on average
+    burst_s: airtime that can be spent at once, after some idle time
+    """
+
+    def __init__(self, duty_cycle: float = 0.1, burst_s: float = 0.005):
+        if not 0 < duty_cycle <= 1:
+            raise ValueError(f"duty_cycle {duty_cycle} not in (0, 1]")
+        if burst_s < TX_SETTLING_S + airtime_s():
+            # Not even one packet would ever be sent
+            raise ValueError(f"burst_s {burst_s} shorter than one packet ({TX_SETTLING_S + airtime_s():.6f} s)")
+        self.duty_cycle = duty_cycle
+        self.burst_s = burst_s
+        self.tokens = burst_s
+        self._last = None
+
+    def take(self, airtime: float, now: float) -> bool:
+        """Spend airtime at clock time now, if available"""
+        if self._last is not None:
+            self.tokens = min(self.burst_s, self.tokens + (now - self._last) * self.duty_cycle)
+        self._last = now
+        if self.tokens < airtime:
+            return False
+        self.tokens -= airtime
+        return True
+
+
+class Timing(collections.namedtuple("Timing", ["queued", "started", "done"])):
+    """Clock times of a command: queued, first and last packet written"""
+
+    __slots__ = ()
+
+    @property
+    def latency(self) -> float:
+        """From queued to the last packet"""
+        return self.done - self.queued
+
+
+class Job:
+    """A packet pending to be written several times"""
+
+    __slots__ = ("id", "packet", "repetitions", "remaining", "hopping", "future",
+                 "queued", "started", "command", "priority", "deadline")
+
+    def __init__(self, id: int, packet: bytes, repetitions: int, hopping=None, priority: int = LEVEL,
+                 deadline: float = None):
+        self.id = id
+        self.packet = packet
+        self.repetitions = repetitions
+        self.remaining = repetitions
+        self.hopping = hopping
+        self.future = Future()
+        self.queued = None
+        self.started = None
+        self.command = None  # Name, for the telemetry
+        self.priority = priority
+        self.deadline = deadline
+
+    @property
+    def channel(self) -> int:
+        """Channel of the next repetition, None if any channel is fine"""
+        if self.hopping is None:
+            return None
+        return self.hopping.channel(self.repetitions - self.remaining)
+
+
+class TxScheduler:
+    """Transmit the queued commands from a background thread.
+
+    Arguments:
+    radio: object with a write(buffer) method, e.g. a configured pyrf24.RF24
+    delay_s: time between rounds of repetitions
+    clock: object with sleep(s) and monotonic() (the time module by default)
+    budget: optional AirtimeBudget
+    """
+
+    def __init__(self, radio, delay_s: float = 0.01, clock=time, budget: AirtimeBudget = None):
+        self.radio = radio
+        self.delay_s = delay_s
+        self.clock = clock
+        self.budget = budget
+        self._lanes = collections.OrderedDict()  # remote id -> deque of jobs
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+        self._channel = None
+        self.telemetry = None  # Optional telemetry.Telemetry
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def start(self):
+        """Start the transmit thread"""
+        with self._cond:
+            if self._running:
+                return
+            self._running = True
+        self._thread = threading.Thread(target=self._run, name="lightbar-tx", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the transmit thread, once the pending commands are sent"""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def submit(self, id: int, packet: bytes, repetitions: int, hopping=None, priority: int = LEVEL,
+               deadline: float = None) -> Future:
+        """Queue a packet, return a future that is done when it is sent.
+
+        Arguments:
+        id: remote id, commands with the same id are sent in order
+        packet: the packet, as built by baseband.packet
+        repetitions: times the packet is written
+        hopping: optional policy.HopPattern, channel of each repetition
+        priority: INTERACTIVE, LEVEL or BACKGROUND
+        deadline: clock time, the command is dropped if not started by then
+
+        The result of the future is its Timing, or DeadlineExpired.
+        """
+        return self.submit_many([(id, packet, repetitions, hopping, priority, deadline)])[0]
+
+    def submit_many(self, items: list) -> list:
+        """Queue several packets at once, so they start in the same round.
+
+        items: (id, packet, repetitions, hopping[, priority[, deadline]])
+               tuples, see submit
+        Return the list of futures.
+        """
+        jobs = [Job(id, bytes(packet), repetitions, *args) for id, packet, repetitions, *args in items]
+        now = self.clock.monotonic()
+        with self._cond:
+            for job in jobs:
+                job.queued = now
+                if job.repetitions <= 0:
+                    job.future.set_result(Timing(now, now, now))
+                    continue
+                self._lanes.setdefault(job.id, collections.deque()).append(job)
+            self._cond.notify()
+        return [job.future for job in jobs]
+
+    @property
+    def pending(self) -> int:
+        """Number of commands not completely sent"""
+        with self._cond:
+            return sum(len(lane) for lane in self._lanes.values())
+
+    def step(self) -> bool:
+        """Write one round of repetitions, return False if there was nothing to send.
+
+        The transmit thread calls it after each delay_s, but it can also be
+        called directly (e.g. in tests), without starting the thread.
+        """
+        with self._cond:
+            heads = [(lane[0], min(job.priority for job in lane)) for lane in self._lanes.values()]
+        if not heads:
+            return False
+        stats = self.telemetry
+        now = self.clock.monotonic()
+        done = []
+        # Only the most urgent class, the others wait
+        urgent = min(priority for _, priority in heads)
+        jobs = [job for job, priority in heads if priority == urgent]
+        # Current channel first, then grouped by channel
+        jobs.sort(key=lambda job: (job.channel not in (None, self._channel), job.channel or 0))
+        cost = TX_SETTLING_S + airtime_s(len(jobs[0].packet))
+        served = []  # Remotes written in this round
+        exhausted = False
+
+        for job in jobs:
+            if not job.future.running() and not job.future.set_running_or_notify_cancel():
+                done.append(job)  # Cancelled before its first packet
+                if stats is not None:
+                    stats.count("dropped", job.id, command_name(job.packet))
+                continue
+            if job.started is None and job.deadline is not None and now > job.deadline:
+                done.append(job)
+                if stats is not None:
+                    stats.count("dropped", job.id, command_name(job.packet))
+                job.future.set_exception(DeadlineExpired(f"not started {now - job.queued:.3f} s after queued"))
+                continue
+            if self.budget is not None and not self.budget.take(cost, self.clock.monotonic()):
+                exhausted = True  # Out of airtime, the rest waits for the next rounds
+                break
+            served.append(job.id)
+            channel = job.channel
+            if job.started is None:
+                job.started = self.clock.monotonic()
+                if stats is not None:
+                    job.command = command_name(job.packet)
+            try:
+                if channel is not None and channel != self._channel:
+                    self.radio.channel = channel
+                    self._channel = channel
+                start = self.clock.monotonic()
+                self.radio.write(job.packet)  # Its result is not a failure (see radio.open_radio)
+                if channel is not None:
+                    job.hopping.stats.record_write(channel, self.clock.monotonic() - start)
+            except Exception as e:
+                if stats is not None:
+                    stats.write(job.id, job.command, error=True)
+                job.future.set_exception(e)
+                done.append(job)
+                continue
+            if stats is not None:
+                stats.write(job.id, job.command)
+            job.remaining -= 1
+            if job.remaining == 0:
+                timing = Timing(job.queued, job.started, self.clock.monotonic())
+                if stats is not None:
+                    stats.burst(job.id, job.command, *timing)
+                job.future.set_result(timing)
+                done.append(job)
+
+        with self._cond:
+            for job in done:
+                lane = self._lanes[job.id]
+                lane.popleft()
+                if not lane:
+                    del self._lanes[job.id]
+            if exhausted:
+                # The remotes left waiting go first in the next rounds
+                for id in served:
+                    if id in self._lanes:
+                        self._lanes.move_to_end(id)
+        return True
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._lanes:
+                    self._cond.wait()
+                if not self._lanes:  # Stopped and nothing left
+                    return
+            self.step()
+            self.clock.sleep(self.delay_s)
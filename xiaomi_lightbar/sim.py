@@ -0,0 +1,128 @@
+import random
+from . import baseband
+from .policy import TX_SETTLING_S, airtime_s
+
+# Simulation of the radio link without hardware, to test and benchmark the
+# transmit strategies (repetitions, hopping, scheduling) deterministically and
+# faster than real time. The duration of each write is the airtime of the
+# packet (see policy.airtime_s).
+
+
+class VirtualClock:
+    """Clock with the interface of the time module: sleep just moves it forward"""
+
+    def __init__(self, start: float = 0.0):
+        self.now = start
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.now += max(seconds, 0.0)
+
+
+class SimulatedRadio:
+    """In-process radio backend (see radio.RadioBackend).
+
+    Each write moves the clock forward by the settling time and the airtime,
+    and delivers the packet to each simulated bar, unless it is lost.
+
+    Arguments:
+    clock: a VirtualClock (a new one by default)
+    loss: packet loss probability, a float or a {channel: probability} dict
+    seed: seed of the random losses
+    """
+
+    def __init__(self, clock: VirtualClock = None, loss=0.0, seed: int = 0):
+        self.clock = VirtualClock() if clock is None else clock
+        self.loss = loss
+        self.channel = 6
+        self.payload_size = 17
+        self.bars = []
+        self.packets = 0  # Written packets
+        self.busy_s = 0.0  # Time transmitting
+        self._random = random.Random(seed)
+
+    @property
+    def is_chip_connected(self) -> bool:
+        return True
+
+    def add_bar(self, bar: "SimulatedBar") -> "SimulatedBar":
+        self.bars.append(bar)
+        return bar
+
+    def loss_probability(self, channel: int) -> float:
+        if isinstance(self.loss, dict):
+            return self.loss.get(channel, 0.0)
+        return self.loss
+
+    def write(self, buf) -> bool:
+        duration = TX_SETTLING_S + airtime_s(self.payload_size)
+        self.clock.sleep(duration)
+        self.packets += 1
+        self.busy_s += duration
+        loss = self.loss_probability(self.channel)
+        for bar in self.bars:
+            if self._random.random() >= loss:
+                bar.receive(bytes(buf), self.channel, self.clock.monotonic())
+        return True
+
+
+class SimulatedBar:
+    """A light bar that decodes packets and tracks its state.
+
+    It drops the packets with a wrong CRC or from other remotes, and the
+    repeated ones (same counter as the last accepted packet). The levels are
+    0 to 15. Steps > 15 saturate, but the change waits for the next step of
+    the same level, like the real bar.
+
+    Arguments:
+    remote_id: id of the paired remote
+    channels: channels it listens on
+    """
+
+    def __init__(self, remote_id: int, channels: tuple = (6, 7, 15, 16, 43, 44, 68, 69)):
+        self.id = remote_id
+        self.channels = channels
+        self.is_on = False
+        self.brightness = 8
+        self.color_temp = 0
+        self.counter = None  # Last accepted counter
+        self.corrupted = 0
+        self.repeated = 0
+        self.log = []  # (time, command name, step) of the accepted commands
+        self._saturated = {}  # level -> value, waiting for the next step
+
+    def receive(self, pkt: bytes, channel: int = 6, time: float = None) -> bool:
+        """Process a packet, return True if it is accepted"""
+        if channel not in self.channels:
+            return False
+        if (len(pkt) != 17 or int.from_bytes(pkt[:8], "big") != baseband.preamble
+                or pkt[11] != baseband.separator
+                or not baseband.crc_ok(pkt)):
+            self.corrupted += 1
+            return False
+        if int.from_bytes(pkt[8:11], "big") != self.id:
+            return False
+        if pkt[12] == self.counter:
+            self.repeated += 1
+            return False
+        self.counter = pkt[12]
+        name, step = baseband.parse_command(int.from_bytes(pkt[13:15], "big"))
+        self.log.append((time, name, step))
+        self._apply(name, step)
+        return True
+
+    def _apply(self, name: str, step: int):
+        if name == "on_off":
+            self.is_on = not self.is_on
+        elif name == "reset":
+            self.brightness, self.color_temp = 8, 0
+            self._saturated.clear()
+        elif name is not None:
+            level = "brightness" if name in ("higher", "lower") else "color_temp"
+            if abs(step) > 15:
+                self._saturated[level] = 0 if step < 0 else 15
+            else:
+                value = self._saturated.pop(level, getattr(self, level))
+                setattr(self, level, min(max(value + step, 0), 15))
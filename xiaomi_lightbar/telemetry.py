@@ -0,0 +1,168 @@
+import bisect
+import collections
+import threading
+from . import baseband
+
+# Telemetry of the transmissions, to tune the repetitions and to spot
+# interference: counters and latency histograms, per remote id and command.
+#
+# Counters:
+# - packets: packets written
+# - write_errors: writes that raised (e.g. SPI errors)
+# - bursts: commands completely sent (all their repetitions)
+# - collapsed: commands superseded before being sent (coalesce.Coalescer)
+# - dropped: commands cancelled before their first packet
+# Histograms (seconds):
+# - queue_s: from queued (or send called) to the first packet
+# - burst_s: from the first to the last packet
+#
+# Every value is also passed to the sinks, callbacks with the arguments
+# (name, remote id, command, value). A counter passes its increment.
+#
+# The return value of the writes is not a failure: the radio has auto-ack on
+# and no retries (see radio.open_radio), and the bar never acknowledges, so
+# every write ends in MAX_RT and returns False. Nothing here measures the
+# packets received by the bar (see scripts/measure_repetitions.py for that).
+#
+# The Lightbar, TxScheduler, RadioBridge and Coalescer have a telemetry
+# attribute, None by default (nothing recorded, no overhead).
+
+BUCKETS_S = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+HISTOGRAMS = ("queue_s", "burst_s")
+
+
+def command_name(pkt) -> str:
+    """Name of the command of a packet, for the labels"""
+    name, _ = baseband.parse_command(pkt[13] << 8 | pkt[14])
+    return "unknown" if name is None else name
+
+
+class Histogram:
+    """Counts of values in buckets (upper bounds), plus their count and sum"""
+
+    def __init__(self, buckets: tuple = BUCKETS_S):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else None
+
+
+class Telemetry:
+    """Counters and histograms of the transmissions, thread safe.
+
+    Arguments:
+    buckets: upper bounds of the histogram buckets, in seconds
+    """
+
+    def __init__(self, buckets: tuple = BUCKETS_S):
+        self.buckets = buckets
+        self.counters = collections.Counter()  # (name, remote id, command) -> int
+        self.histograms = {}  # (name, remote id, command) -> Histogram
+        self.sinks = []
+        self._lock = threading.Lock()
+
+    def add_sink(self, callback):
+        """Call callback(name, remote id, command, value) with every value"""
+        self.sinks.append(callback)
+
+    def count(self, name: str, id: int, command: str, n: int = 1):
+        with self._lock:
+            self.counters[(name, id, command)] += n
+        for sink in self.sinks:
+            sink(name, id, command, n)
+
+    def observe(self, name: str, id: int, command: str, value: float):
+        with self._lock:
+            key = (name, id, command)
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(self.buckets)
+            self.histograms[key].observe(value)
+        for sink in self.sinks:
+            sink(name, id, command, value)
+
+    def write(self, id: int, command: str, error: bool = False):
+        """Record a packet written, or a write that raised"""
+        self.count("packets", id, command)
+        if error:
+            self.count("write_errors", id, command)
+
+    def burst(self, id: int, command: str, queued: float, started: float, done: float):
+        """Record a command completely sent, with its clock times"""
+        self.count("bursts", id, command)
+        self.observe("queue_s", id, command, started - queued)
+        self.observe("burst_s", id, command, done - started)
+
+    def total(self, name: str, id: int = None) -> int:
+        """Sum of a counter (or count of a histogram), of a remote id or all"""
+        with self._lock:
+            if name in HISTOGRAMS:
+                return sum(h.count for (n, i, _), h in self.histograms.items()
+                           if n == name and id in (None, i))
+            return sum(v for (n, i, _), v in self.counters.items() if n == name and id in (None, i))
+
+    def mean(self, name: str, id: int = None) -> float:
+        """Mean of a histogram, of a remote id or all, None if empty"""
+        with self._lock:
+            selected = [h for (n, i, _), h in self.histograms.items() if n == name and id in (None, i)]
+        count = sum(h.count for h in selected)
+        return sum(h.sum for h in selected) / count if count else None
+
+    def prometheus(self, prefix: str = "xiaomi_lightbar") -> str:
+        """All the values, in the Prometheus text format"""
+        lines = []
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+            histograms = [(key, list(h.counts), h.count, h.sum) for key, h in histograms]
+        for name in sorted({key[0] for key, _ in counters}):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            for (n, id, command), value in counters:
+                if n == name:
+                    lines.append(f'{prefix}_{name}_total{{remote="{id:06x}",command="{command}"}} {value}')
+        for name in sorted({key[0] for key, *_ in histograms}):
+            lines.append(f"# TYPE {prefix}_{name} histogram")
+            for (n, id, command), counts, count, total in histograms:
+                if n != name:
+                    continue
+                labels = f'remote="{id:06x}",command="{command}"'
+                cumulative = 0
+                for bound, c in zip(self.buckets + ("+Inf",), counts):
+                    cumulative += c
+                    lines.append(f'{prefix}_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"{prefix}_{name}_sum{{{labels}}} {total}")
+                lines.append(f"{prefix}_{name}_count{{{labels}}} {count}")
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(telemetry: Telemetry, port: int, host: str = ""):
+    """Serve the telemetry in the Prometheus text format, from a background thread.
+
+    Any path works (e.g. http://host:port/metrics). Call shutdown() on the
+    returned http.server.ThreadingHTTPServer to stop it.
+    """
+    import http.server  # Only for the services, it is slow to import
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = telemetry.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="lightbar-metrics", daemon=True).start()
+    return server